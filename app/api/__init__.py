@@ -3,12 +3,13 @@ API endpoints module.
 """
 
 from fastapi import APIRouter
-from .endpoints import chat, health, models
+from fastapi.responses import ORJSONResponse
+from .endpoints import chat_router, health_router, models_router
 
-# Создаем основной роутер API
-router = APIRouter()
+# Создаем основной роутер API (ответы сериализуются через orjson)
+router = APIRouter(default_response_class=ORJSONResponse)
 
 # Включаем все эндпоинты из модулей
-router.include_router(health.router, tags=["Health"])
-router.include_router(models.router, tags=["Models"])
-router.include_router(chat.router, tags=["Chat"])
\ No newline at end of file
+router.include_router(health_router, tags=["Health"])
+router.include_router(models_router, tags=["Models"])
+router.include_router(chat_router, tags=["Chat"])
\ No newline at end of file
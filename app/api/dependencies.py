@@ -1,61 +1,88 @@
-from fastapi import Depends, HTTPException, status
+import hashlib
+import math
+from typing import Optional
+from fastapi import HTTPException, Request, Security, status
+from app.core.config import settings
 from app.services.models_service import LlamaService
-from app.dependencies import get_llama_service
-from app.core.security import verify_api_key
+from app.services.rate_limiter import get_rate_limiter
+from app.core.security import api_key_scheme, api_key_matches, check_api_key
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-async def get_llama_service_handler_non_connection_pool(
-        llama_service: LlamaService = Depends(get_llama_service),
-) -> LlamaService:
-    """Зависимость для проверки доступности сервиса LLM."""
-    if not llama_service.is_loaded:
+async def rate_limit(request: Request, api_key: Optional[str] = Security(api_key_scheme)) -> None:
+    """
+    Ограничение частоты запросов по алгоритму token bucket.
+    Ключ ведра - хэш API ключа, если ключ проверен, иначе IP клиента:
+    произвольные ключи (в том числе при выключенной аутентификации) не дают
+    обойти лимит и не создают новое ведро на каждый запрос.
+    """
+    if not settings.rate_limit.enabled:
+        return
+
+    if api_key_matches(api_key):
+        client_key = "key:" + hashlib.sha256(api_key.encode()).hexdigest()
+    else:
+        client_key = "ip:" + (request.client.host if request.client else "unknown")
+
+    try:
+        allowed, retry_after = await get_rate_limiter().acquire(client_key)
+    except Exception as e:
+        # Недоступность хранилища лимитов не должна блокировать обслуживание запросов
+        logger.error("Rate limiter error: %s", e)
+        return
+
+    if not allowed:
         raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="LLM model is not loaded",
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
         )
-        
-    return llama_service
 
 
-async def get_llama_service_handler(
-        llama_service: LlamaService = Depends(get_llama_service),
-) -> LlamaService:
-    """Зависимость для проверки доступности сервиса LLM."""
-    if not llama_service.is_loaded:
+def _loaded_service(request: Request) -> LlamaService:
+    """
+    Сервис, сохраненный в app.state при старте приложения.
+    Чтение атрибута не требует await и блокировок на каждом запросе.
+    """
+    llama_service = getattr(request.app.state, "llama_service", None)
+
+    if llama_service is None or not llama_service.is_loaded:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="LLM model is not loaded",
         )
 
-    # Проверяем, есть ли свободные инстансы для обработки запроса
-    if not llama_service.is_available:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Service is busy. Maximum concurrent requests: {llama_service.model_pool.max_concurrent_requests}, "
-                   f"Current active requests: {llama_service.model_pool.active_requests_count}, "
-                   f"Total instances: {llama_service.model_pool.total_count}"
-        )
+    return llama_service
 
-    # Дополнительная проверка: если сервис почти перегружен, предупреждаем
-    if llama_service.model_pool.active_requests_count >= llama_service.model_pool.max_concurrent_requests:
-        logger.warning(
-            f"Service near capacity: {llama_service.model_pool.active_requests_count}/"
-            f"{llama_service.model_pool.max_concurrent_requests} active requests"
-        )
+
+async def llama_dep(request: Request, api_key: Optional[str] = Security(api_key_scheme)) -> LlamaService:
+    """
+    Единая зависимость для эндпоинтов генерации.
+    Получает сервис и выполняет проверки загрузки модели
+    и API ключа без вложенных Depends.
+    """
+    llama_service = _loaded_service(request)
+
+    # Свободный инстанс не требуется: запрос дождется его в очереди пула.
+    # Строка предупреждения формируется только при его выводе
+    pool = llama_service.model_pool
+    active = pool.active_requests_count
+    max_concurrent = pool.max_concurrent_requests
+    if active >= max_concurrent:
+        logger.warning("Service at capacity: %d/%d active requests, request will be queued",
+                       active, max_concurrent)
+
+    check_api_key(api_key)
 
     return llama_service
 
 
-async def require_api_key_handler(
-    api_key_verified: bool = Depends(verify_api_key)
-) -> bool:
-    """Зависимость для проверки API ключа."""
-    if not api_key_verified:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid API Key"
-        )
-    return True
\ No newline at end of file
+async def loaded_llama_dep(request: Request) -> LlamaService:
+    """
+    Зависимость для служебных эндпоинтов (health, models).
+    Проверяет только загрузку модели: пул и API ключ не учитываются,
+    чтобы пробы балансировщика не зависели от нагрузки.
+    """
+    return _loaded_service(request)
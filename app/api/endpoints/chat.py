@@ -1,39 +1,70 @@
-import uuid
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response, StreamingResponse
+from pydantic import ValidationError
 from app.models.schemas import ChatCompletionRequest
 from app.services.models_service import LlamaService
-from app.api.dependencies import get_llama_service_handler, require_api_key_handler
+from app.api.dependencies import llama_dep, rate_limit
 from app.exceptions import ServiceUnavailableError
+from app.core.ids import random_hex
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Рекомендуемая клиенту пауза перед повтором, если очередь пула не освободилась
+_RETRY_AFTER_SECONDS = "1"
 
-@router.post("/chat/completions")
+# Заголовки потокового ответа (SSE)
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    # Запрещаем буферизацию ответа на прокси (nginx и совместимые)
+    "X-Accel-Buffering": "no",
+}
+
+
+# Тело запроса разбирается вручную, поэтому схему для OpenAPI описываем явно
+_REQUEST_BODY_SCHEMA = {
+    "requestBody": {
+        "content": {"application/json": {"schema": ChatCompletionRequest.model_json_schema()}},
+        "required": True,
+    }
+}
+
+
+@router.post(
+    "/chat/completions",
+    dependencies=[Depends(rate_limit)],
+    openapi_extra=_REQUEST_BODY_SCHEMA,
+)
 async def chat_completion(
-        request: ChatCompletionRequest,
-        llama_service: LlamaService = Depends(get_llama_service_handler),
-        api_key: bool = Depends(require_api_key_handler),
+        http_request: Request,
+        llama_service: LlamaService = Depends(llama_dep),
 ):
     """
     Эндпоинт совместимый с OpenAI API для обработки запросов чата.
     Поддерживает как обычные запросы, так и потоковую передачу.
     """
 
-    # Генерируем уникальный session_id для каждого запроса
-    session_id = f"req_{uuid.uuid4().hex}"
+    # Разбираем JSON и строим модель за один проход pydantic-core,
+    # минуя промежуточный dict, который создает FastAPI
+    try:
+        request = ChatCompletionRequest.model_validate_json(await http_request.body())
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+        )
 
-    logger.info(f"Chat request Model: {request.model}, "
-                f"Messages: {len(request.messages)}, "
-                f"Temperature: {request.temperature}, "
-                f"Stream: {request.stream}, "
-                f"Tools: {len(request.tools) if request.tools else 0}")
+    # Генерируем уникальный session_id для каждого запроса
+    session_id = "req_" + random_hex()
 
-    if request.tools:
-        logger.info(f"Tools requested: {[tool.function.name for tool in request.tools]}")
+    if logger.isEnabledFor(logging.INFO):
+        # Параметры запроса и запрошенные инструменты выводятся одной записью
+        logger.info("Chat request Model: %s, Messages: %d, Temperature: %s, Stream: %s, Tools: %s",
+                    request.model, len(request.messages), request.temperature, request.stream,
+                    [tool.function.name for tool in request.tools] if request.tools else 0)
 
     try:
         if request.stream:
@@ -47,13 +78,12 @@ async def chat_completion(
                 tools=request.tools,
                 session_id=session_id
             )
+            # generate_response_stream - нативный async-генератор кадров SSE (bytes):
+            # Starlette не уводит итерацию в threadpool
             return StreamingResponse(
                 response_generator,
                 media_type="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                }
+                headers=_SSE_HEADERS
             )
         else:
             # Обычный режим
@@ -67,16 +97,18 @@ async def chat_completion(
                 session_id=session_id
             )
             logger.info("Chat request: Response generated successfully")
-            return response
+            # Ответ сериализуется pydantic-core сразу в байты, минуя обход jsonable_encoder
+            return Response(content=response.model_dump_json(), media_type="application/json")
 
     except ServiceUnavailableError as e:
-        logger.warning(f"Service unavailable: {str(e)}")
+        logger.warning("Service unavailable: %s", e)
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Service temporarily unavailable. Please try again later."
+            detail="Service temporarily unavailable. Please try again later.",
+            headers={"Retry-After": _RETRY_AFTER_SECONDS},
         )
     except Exception as e:
-        logger.error(f"Chat request Error: {str(e)}", exc_info=True)
+        logger.error("Chat request Error: %s", e, exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error generating response: {str(e)}"
@@ -1,8 +1,8 @@
 import logging
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from app.models.schemas import HealthResponse
 from app.services.models_service import LlamaService
-from app.api.dependencies import get_llama_service_handler_non_connection_pool
+from app.api.dependencies import loaded_llama_dep
 
 
 logger = logging.getLogger(__name__)
@@ -10,12 +10,23 @@ router = APIRouter()
 
 @router.get("/health", response_model=HealthResponse)
 async def health_check(
-    llama_service: LlamaService = Depends(get_llama_service_handler_non_connection_pool)
+    llama_service: LlamaService = Depends(loaded_llama_dep)
 ):
     """Проверка статуса сервиса и загрузки модели."""
     logger.info("Health requested")
-    return HealthResponse(
-        status="healthy",
-        model_loaded=llama_service.is_loaded,
-        model_name=llama_service.model_name if llama_service.is_loaded else None,
-    )
\ No newline at end of file
+    # Тело ответа закэшировано в сервисе: валидация и сериализация не выполняются
+    return Response(content=llama_service.health_json, media_type="application/json")
+
+@router.get("/health/ready", response_model=HealthResponse)
+async def readiness_check(request: Request):
+    """
+    Проба готовности: 503, пока модель не загружена и пул не инициализирован.
+    Занятость пула не учитывается: экземпляр с занятыми моделями остается в балансировке.
+    """
+    llama_service = getattr(request.app.state, "llama_service", None)
+    if not getattr(request.app.state, "ready", False) or llama_service is None or not llama_service.is_loaded:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Service is not ready",
+        )
+    return Response(content=llama_service.health_json, media_type="application/json")
@@ -1,8 +1,8 @@
 import logging
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response
 from app.models.schemas import ModelsListResponse
 from app.services.models_service import LlamaService
-from app.api.dependencies import get_llama_service_handler_non_connection_pool
+from app.api.dependencies import loaded_llama_dep
 
 
 logger = logging.getLogger(__name__)
@@ -10,17 +10,9 @@ router = APIRouter()
 
 @router.get("/models", response_model=ModelsListResponse)
 async def list_models(
-    llama_service: LlamaService = Depends(get_llama_service_handler_non_connection_pool),
+    llama_service: LlamaService = Depends(loaded_llama_dep),
 ):
     """Список доступных моделей."""
     logger.info("Models list requested")
-    return ModelsListResponse(
-        data=[
-            {
-                "id": llama_service.model_name,
-                "object": "model",
-                "owned_by": "local",
-                "permissions": []
-            }
-        ]
-    )
\ No newline at end of file
+    # Тело ответа сериализуется один раз при загрузке модели
+    return Response(content=llama_service.models_json, media_type="application/json")
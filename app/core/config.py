@@ -1,11 +1,21 @@
+import copy
+import functools
 import yaml
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 import os
 from pathlib import Path
 
-# Глобальный экземпляр настроек
-_settings = None
+# C-реализация загрузчика (libyaml), если PyYAML собран с ней
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_yaml(config_path: str, mtime: float) -> dict:
+    """Чтение YAML файла; результат кэшируется по пути и времени изменения файла"""
+    with open(config_path, 'r') as f:
+        return yaml.load(f, Loader=_YAML_LOADER) or {}
+
 
 class ServerConfig(BaseModel):
     host: str = "0.0.0.0"
@@ -13,6 +23,7 @@ class ServerConfig(BaseModel):
     log_level: str = "INFO"
     docs_url: str = "/docs"
     redoc_url: str = "/redoc"
+    workers: int = 1  # Количество процессов uvicorn (каждый загружает свой пул моделей)
 
 
 class CorsConfig(BaseModel):
@@ -35,6 +46,7 @@ class ModelConfig(BaseModel):
     n_threads_batch: int = 4  # Количество потоков для батчей
     n_batch: int = 512  # Размер батча
     n_ubatch: int = 512  # Размер микро-батча
+    queue_timeout: float = 30.0  # Максимальное ожидание свободного инстанса, сек
 
     def __init__(self, **data):
         # Приоритет переменных окружения над YAML-конфигурацией
@@ -74,6 +86,10 @@ class ModelConfig(BaseModel):
         if n_ubatch_env is not None:
             data['n_ubatch'] = int(n_ubatch_env)
 
+        queue_timeout_env = os.environ.get('MODEL_QUEUE_TIMEOUT')
+        if queue_timeout_env is not None:
+            data['queue_timeout'] = float(queue_timeout_env)
+
         super().__init__(**data)
 
 
@@ -81,6 +97,8 @@ class GenerationConfig(BaseModel):
     default_temperature: float = 0.7
     default_max_tokens: int = 256
     stream: bool = False
+    stream_batch_max_tokens: int = 16  # Сколько текстовых чанков модели склеивается в один SSE-кадр (1 - без склейки; запросы с tools не склеиваются)
+    stream_batch_max_ms: float = 0.0  # Сколько мс ждать следующие чанки для склейки (0 - только уже готовые)
 
 
 class AppConfig(BaseModel):
@@ -101,12 +119,17 @@ class LoggingConfig(BaseModel):
     file: Optional[str] = None
     max_size: int = 10485760
     backup_count: int = 5
+    max_body_log_bytes: int = 4096  # Сколько байт тела запроса и ответа попадает в лог
+    skip_body_paths: List[str] = ["/v1/chat/completions"]  # Префиксы путей, для которых тело ответа не логируется
+    log_stream_content: bool = False  # Собирать и логировать текст потоковых ответов
+    queue_size: int = 10000  # Размер очереди записей лога (при переполнении записи отбрасываются)
 
 
 class CachingConfig(BaseModel):
-    enabled: bool = True
+    enabled: bool = True  # Кэш не-потоковых ответов по точному совпадению запроса и объединение одинаковых выполняющихся запросов
     ttl: int = 300
     max_size: int = 1000
+    allow_sampling: bool = False  # Кэшировать и ответы с temperature > 0 (по умолчанию только temperature == 0)
 
 
 class SecurityConfig(BaseModel):
@@ -121,6 +144,21 @@ class SecurityConfig(BaseModel):
         super().__init__(**data)
 
 
+class RateLimitConfig(BaseModel):
+    enabled: bool = False
+    backend: Literal["memory", "redis"] = "memory"  # redis - общий лимит для нескольких инстансов
+    capacity: int = 10  # Максимальное количество токенов в "ведре"
+    refill_rate: float = 1.0  # Скорость пополнения, токенов в секунду
+    redis_url: Optional[str] = None
+    key_prefix: str = "llm-svc:ratelimit:"
+
+    def __init__(self, **data):
+        # Инициализация адреса Redis из переменных окружения, если он не задан в конфиге
+        if 'redis_url' not in data or data['redis_url'] is None:
+            data['redis_url'] = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+        super().__init__(**data)
+
+
 class NexusConfig(BaseModel):
     enabled: bool = False
     url: str = ""
@@ -132,6 +170,7 @@ class NexusConfig(BaseModel):
     login: Optional[str] = None
     password: Optional[str] = None
     cert_path: Optional[str] = None
+    download_timeout: Optional[float] = None  # Максимальное время загрузки модели, сек (None - без ограничения)
 
     def __init__(self, **data):
         # Инициализация параметров аутентификации из переменных окружения, если они не заданы в конфиге
@@ -154,6 +193,7 @@ class Settings(BaseModel):
     logging: LoggingConfig = LoggingConfig()
     caching: CachingConfig = CachingConfig()
     security: SecurityConfig = SecurityConfig()
+    rate_limit: RateLimitConfig = RateLimitConfig()
     nexus: NexusConfig = NexusConfig()
 
     @classmethod
@@ -177,30 +217,25 @@ class Settings(BaseModel):
                 return cls()
 
         try:
-            with open(config_path, 'r') as f:
-                config_data = yaml.safe_load(f)
-                if config_data is None:
-                    config_data = {}
-                return cls(**config_data)
+            config_data = _load_yaml(str(config_path), os.path.getmtime(config_path))
+            # Копируем, чтобы не изменять закэшированный результат
+            return cls(**copy.deepcopy(config_data))
         except Exception as e:
             raise ValueError(f"Error loading config from {config_path}: {str(e)}")
 
 
+@functools.lru_cache(maxsize=1)
 def get_settings() -> Settings:
-    """Получение экземпляра настроек."""
-    global _settings
-    if _settings is None:
-        config_path = os.environ.get("CONFIG_PATH")
-        _settings = Settings.from_yaml(config_path)
-    return _settings
+    """Получение экземпляра настроек (загружается один раз и кэшируется)."""
+    config_path = os.environ.get("CONFIG_PATH")
+    return Settings.from_yaml(config_path)
 
 def reset_settings() -> Settings:
     """Сброс и принудительная перезагрузка настроек."""
-    global _settings, settings
-    config_path = os.environ.get("CONFIG_PATH")
-    _settings = Settings.from_yaml(config_path)
-    settings = _settings  # Обновляем глобальную переменную
-    return _settings
+    global settings
+    get_settings.cache_clear()
+    settings = get_settings()  # Обновляем глобальную переменную
+    return settings
 
 # Инициализация настроек
 settings = get_settings()
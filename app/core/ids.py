@@ -0,0 +1,23 @@
+"""
+Идентификаторы ответов, сессий и запросов.
+Генератор псевдослучайных чисел засевается из os.urandom один раз на процесс:
+идентификаторы уникальны, но не секретны, поэтому системный вызов на каждый не нужен.
+"""
+
+import os
+import random
+
+_rng = random.Random(os.urandom(16))
+
+
+def _reseed() -> None:
+    """Новое зерно в дочернем процессе после fork, чтобы идентификаторы процессов не совпадали"""
+    _rng.seed(os.urandom(16))
+
+
+os.register_at_fork(after_in_child=_reseed)
+
+
+def random_hex(nbytes: int = 16) -> str:
+    """Случайная hex-строка из nbytes байт (2 * nbytes символов)"""
+    return f"{_rng.getrandbits(nbytes * 8):0{nbytes * 2}x}"
@@ -2,42 +2,66 @@
 Модуль для функций безопасности (аутентификация, авторизация и т.д.)
 """
 
-from fastapi import HTTPException, status, Depends, Header
+import functools
+import hashlib
+import hmac
+import logging
+from typing import Optional
+from fastapi import HTTPException, status
+from fastapi.security import APIKeyHeader
 from app.core.config import get_settings
 
+logger = logging.getLogger(__name__)
+
 settings = get_settings()
 
-async def verify_api_key(x_api_key: str = Header(None)):
+# Поля конфигурации, читаемые на каждом запросе, привязываются один раз при импорте
+_SEC_ENABLED = settings.security.enabled
+# Храним только SHA-256 дайджест ключа: сравнение идет по 32 байтам независимо от длины ключа
+_API_KEY_DIGEST = (
+    hashlib.sha256(settings.security.api_key.encode()).digest()
+    if settings.security.api_key else None
+)
+
+if _SEC_ENABLED and _API_KEY_DIGEST is None:
+    logger.warning("API key authentication is enabled, but API key is not configured on server: "
+                   "all protected requests will be rejected")
+
+# Схема безопасности: заголовок с ключом попадает в securitySchemes OpenAPI
+api_key_scheme = APIKeyHeader(name=settings.security.api_key_header, auto_error=False)
+
+
+@functools.lru_cache(maxsize=1024)
+def _digest(api_key: str) -> bytes:
+    """SHA-256 дайджест ключа из запроса (повторные клиенты не пересчитывают хэш)"""
+    return hashlib.sha256(api_key.encode()).digest()
+
+
+def api_key_matches(api_key: Optional[str]) -> bool:
+    """
+    Аутентификация включена и передан настроенный на сервере API ключ.
+    Проверка без исключения: единый признак проверенного ключа для авторизации и лимитов.
+    """
+    return bool(_SEC_ENABLED and _API_KEY_DIGEST and api_key
+                and hmac.compare_digest(_digest(api_key), _API_KEY_DIGEST))
+
+
+def check_api_key(api_key: Optional[str]) -> bool:
     """
-    Проверка API ключа из заголовка запроса.
+    Синхронная проверка API ключа, используемая внутри зависимостей.
+    Ненастроенный, отсутствующий и неверный ключ отклоняются одинаково.
     """
-    
+
     # Если аутентификация отключена, пропускаем проверку
-    if not settings.security.enabled:
+    if not _SEC_ENABLED:
         return True
-    
-    # Если аутентификация включена, но ключ не задан в конфигурации
-    if not settings.security.api_key:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="API key is not configured on server",
-            headers={"WWW-Authenticate": "API-Key"},
-        )
-    
-    # Если заголовок не передан
-    if not x_api_key:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="API key is missing",
-            headers={"WWW-Authenticate": "API-Key"},
-        )
-    
-    # Проверка ключа
-    if x_api_key != settings.security.api_key:
+
+    if not api_key_matches(api_key):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key",
             headers={"WWW-Authenticate": "API-Key"},
         )
-    
-    return True
\ No newline at end of file
+
+    return True
+
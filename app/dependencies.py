@@ -4,9 +4,6 @@ async def get_llama_service() -> LlamaService:
     """Зависимость для получения сервиса LLM"""
     return await LlamaService.get_instance()
 
-# Для обратной совместимости
-get_llama_handler = get_llama_service
-
 async def cleanup_llama_service() -> None:
     """Очистка сервиса LLM"""
     service = await LlamaService.get_instance()
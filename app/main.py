@@ -1,119 +1,214 @@
-import json
-import time
-import uuid
+import asyncio
+import atexit
+import os
+import queue
+import signal
+import sys
+import threading
 import uvicorn
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from starlette.background import BackgroundTask
+from fastapi.responses import ORJSONResponse
 import logging.config
+from logging.handlers import QueueHandler, QueueListener
 
-from app.core.config import settings
+from app.core.config import get_settings
 from app.api import router as api_router
 from app.dependencies import get_llama_service, cleanup_llama_service
-from app.middleware.logging_middleware import LoggingMiddleware
+from app.middleware.logging_middleware import LoggingMiddleware, build_log_strategies
+from app.middleware.readiness_middleware import ReadinessMiddleware
+from app.exceptions import ServiceUnavailableError
 from app.services.nexus_client import download_model_from_nexus_if_needed
+from app.services.http_clients import close_http_clients
+from app.services.rate_limiter import close_rate_limiter
 
 from fastapi import Request
 
+# Логгеры приложения, которые пишут напрямую в консольный обработчик
+_APP_LOGGERS = ('app', 'app.api', 'app.services', '__main__')
+
+_logging_configured = False
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler, который отбрасывает записи при переполнении очереди вместо блокировки"""
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Форматирование сообщения (и трассировки исключения) выполняет поток
+        # QueueListener, а не поток запроса. Обработчики слушателя должны быть
+        # потокобезопасными (StreamHandler таким является)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
 # Настройка логирования
 def setup_logging():
-    """Настройка централизованного логирования для всего приложения"""
+    """
+    Настройка централизованного логирования для всего приложения (выполняется один раз).
+    Логгеры только ставят записи в очередь, запись в stdout выполняет
+    фоновый поток QueueListener, не блокируя цикл событий.
+    """
+    global _logging_configured
+    if _logging_configured:
+        return
+
+    logging_config = get_settings().logging
+    level = logging_config.level
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(logging_config.format))
+    stream_handler.setLevel(level)
+
+    log_queue = queue.Queue(maxsize=logging_config.queue_size)
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    # При завершении процесса дописываем оставшиеся в очереди записи
+    atexit.register(listener.stop)
+
     logging.config.dictConfig({
         'version': 1,
         'disable_existing_loggers': False,  # Важно: не отключаем существующие логгеры
-        'formatters': {
-            'default': {
-                'format': settings.logging.format
-            }
-        },
         'handlers': {
             'console': {
-                'class': 'logging.StreamHandler',
-                'formatter': 'default',
-                'level': settings.logging.level,
-                'stream': 'ext://sys.stdout'
+                '()': DroppingQueueHandler,
+                'queue': log_queue,
+                'level': level,
             }
         },
         'root': {
             'handlers': ['console'],
-            'level': settings.logging.level
+            'level': level
         },
         'loggers': {
-            'app': {
-                'handlers': ['console'],
-                'level': settings.logging.level,
-                'propagate': False
-            },
-            'app.api': {
-                'handlers': ['console'],
-                'level': settings.logging.level,
-                'propagate': False
-            },
-            'app.services': {
-                'handlers': ['console'],
-                'level': settings.logging.level,
-                'propagate': False
-            },
-            'app.services.llama_handler': {  # Явно настраиваем логгер для llama_handler
-                'handlers': ['console'],
-                'level': settings.logging.level,
-                'propagate': False
-            },
-            '__main__': {
-                'handlers': ['console'],
-                'level': settings.logging.level,
-                'propagate': False
-            }
+            name: {'handlers': ['console'], 'level': level, 'propagate': False}
+            for name in _APP_LOGGERS
         }
     })
-
-# Настраиваем логирование при импорте модуля
-setup_logging()
+    _logging_configured = True
 
 logger = logging.getLogger(__name__)
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
+async def _initialize_service(app: FastAPI) -> None:
     """
-    Lifespan менеджер для управления жизненным циклом приложения.
-    Отделяет инициализацию ресурсов от их использования в зависимостях.
+    Загрузка модели и инициализация сервиса LLM в фоне.
+    До завершения запросы отклоняются ReadinessMiddleware с 503.
+    Ошибка инициализации сохраняется в app.state.init_error и пробрасывается дальше.
     """
-    # Инициализация при запуске
+    download_task = None
+    cancel_download = threading.Event()
     try:
         logger.info("Starting application initialization...")
 
-        # Загружаем модель из Nexus при необходимости
-        if not download_model_from_nexus_if_needed():
+        # Загружаем модель из Nexus при необходимости в отдельном потоке,
+        # параллельно с подготовкой сервиса и без блокировки цикла событий
+        download_task = asyncio.create_task(
+            asyncio.to_thread(download_model_from_nexus_if_needed, cancel_download)
+        )
+        llama_service = await get_llama_service()
+
+        if not await asyncio.wait_for(download_task, timeout=get_settings().nexus.download_timeout):
             logger.error("Failed to download model from Nexus")
             raise RuntimeError("Failed to download model from Nexus")
 
         # Предварительная инициализация сервиса LLM
-        llama_service = await get_llama_service()
         await llama_service.initialize()
+        # Зависимости читают готовый сервис из app.state без обращения к синглтону
+        app.state.llama_service = llama_service
+        app.state.ready = True
 
         logger.info("Application started successfully")
 
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
-        logger.error(f"Failed to initialize application: {str(e)}")
+        logger.error("Failed to initialize application: %s", e, exc_info=True)
+        app.state.init_error = e
         # Гарантируем очистку ресурсов при ошибке инициализации
         await cleanup_llama_service()
         raise
+    finally:
+        # Загрузка не должна пережить инициализацию (ошибка, отмена, download_timeout):
+        # отмена задачи не прерывает поток asyncio.to_thread, поэтому поток
+        # останавливается событием и удаляет недокачанный файл
+        cancel_download.set()
+        if download_task is not None and not download_task.done():
+            download_task.cancel()
+
+
+def _on_initialization_done(task: asyncio.Task) -> None:
+    """
+    Ошибка инициализации фатальна: процесс останавливается (SIGTERM - штатное
+    завершение uvicorn), чтобы оркестратор перезапустил его, а не держал
+    экземпляр, навсегда отвечающий 503.
+    """
+    if task.cancelled() or task.exception() is None:
+        return
+    # Сигнал отправляется, только если сервер перехватывает SIGTERM (uvicorn):
+    # приложение, запущенное без сервера (TestClient), не завершает чужой процесс
+    if signal.getsignal(signal.SIGTERM) in (signal.SIG_DFL, signal.SIG_IGN, None):
+        logger.critical("Initialization failed, service stays unavailable")
+        return
+    logger.critical("Initialization failed, shutting down the server")
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Lifespan менеджер для управления жизненным циклом приложения.
+    Сервер начинает принимать соединения сразу, инициализация идет в фоне.
+    """
+    app.state.ready = False
+    app.state.init_error = None
+    init_task = asyncio.create_task(_initialize_service(app))
+    init_task.add_done_callback(_on_initialization_done)
 
     yield  # Приложение работает
 
     # Очистка при завершении
+    app.state.ready = False
+    if not init_task.done():
+        init_task.cancel()
+        try:
+            await init_task
+        except asyncio.CancelledError:
+            pass
     try:
         await cleanup_llama_service()
+        await close_http_clients()
+        await close_rate_limiter()
         logger.info("Application shut down gracefully")
     except Exception as e:
-        logger.error(f"Error during application shutdown: {str(e)}")
+        logger.error("Error during application shutdown: %s", e)
+
+
+async def service_unavailable_handler(request: Request, exc: ServiceUnavailableError) -> ORJSONResponse:
+    """Ошибки недоступности сервиса (загрузка модели, занятость пула) отдаются как 503"""
+    return ORJSONResponse(
+        {"detail": str(exc) or "Service temporarily unavailable"},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
 
 
 def create_application() -> FastAPI:
-    """Создание и настройка FastAPI приложения"""
+    """Создание и настройка FastAPI приложения (фабрика для uvicorn --factory)"""
+    setup_logging()
+
+    # Кэшированные настройки: повторный вызов фабрики не перечитывает конфигурацию,
+    # а сброс через reset_settings() учитывается без повторного импорта модуля
+    settings = get_settings()
+
     application = FastAPI(
         title=settings.app.title,
         description=settings.app.description,
@@ -121,29 +216,48 @@ def create_application() -> FastAPI:
         lifespan=lifespan,
         docs_url=settings.server.docs_url,
         redoc_url=settings.server.redoc_url,
+        default_response_class=ORJSONResponse,
     )
 
-    # Настройка CORS
+    # Настройка CORS: списки из настроек фиксируются один раз при сборке приложения
+    cors = settings.cors
     application.add_middleware(
         CORSMiddleware,
-        allow_origins=settings.cors.allowed_origins,
-        allow_credentials=settings.cors.allow_credentials,
-        allow_methods=settings.cors.allow_methods,
-        allow_headers=settings.cors.allow_headers,
+        allow_origins=tuple(cors.allowed_origins),
+        allow_credentials=cors.allow_credentials,
+        allow_methods=tuple(cors.allow_methods),
+        allow_headers=tuple(cors.allow_headers),
     )
 
+    application.add_exception_handler(ServiceUnavailableError, service_unavailable_handler)
+
     # Подключение роутеров
     application.include_router(api_router, prefix="/v1")
 
+    # Логирование запросов - внешний слой стека middleware.
+    # Стратегия для каждого пути определяется заранее по зарегистрированным маршрутам
+    application.add_middleware(LoggingMiddleware, strategies=build_log_strategies(application.routes))
+
+    # Отказ 503 до завершения инициализации - самый внешний слой (пробы и документация не блокируются)
+    application.add_middleware(
+        ReadinessMiddleware,
+        exempt_paths=[p for p in ("/v1/health", settings.server.docs_url, settings.server.redoc_url,
+                                  application.openapi_url) if p],
+    )
+
     return application
 
-app = create_application()
-app.add_middleware(LoggingMiddleware)
 
 if __name__ == "__main__":
+    # Приложение собирается фабрикой в каждом воркере, а не при импорте модуля
+    server = get_settings().server
     uvicorn.run(
-        app,
-        host=settings.server.host,
-        port=settings.server.port,
-        log_level=settings.server.log_level.lower(),
+        "app.main:create_application",
+        factory=True,
+        workers=server.workers,
+        host=server.host,
+        port=server.port,
+        log_level=server.log_level.lower(),
+        loop="uvloop",
+        http="httptools",
     )
\ No newline at end of file
@@ -1,214 +1,332 @@
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response, StreamingResponse
-from starlette.background import BackgroundTask
-import uuid
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import time
-import json
+import orjson
 import logging
-from typing import AsyncGenerator, List, Optional
+from typing import Dict, Iterable, List, Optional
+from app.core.config import settings
+from app.core.ids import random_hex
 
 logger = logging.getLogger(__name__)
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    """Упрощенное middleware для логирования запросов и ответов"""
-    
-    async def dispatch(self, request: Request, call_next):
-        request_id = str(uuid.uuid4())
-        start_time = time.time()
+# Функции горячего пути, привязанные один раз (без поиска атрибута модуля на каждом вызове)
+_perf_counter = time.perf_counter
+_orjson_loads = orjson.loads
+
+# Заголовки запроса, попадающие в debug-лог (остальные, включая ключи доступа, не логируются)
+LOGGED_HEADERS = ("user-agent", "x-request-id", "content-type", "content-length")
+
+# Префикс кадра SSE
+_SSE_PREFIX = b"data:"
+
+# Ключ текста ответа в SSE-кадре (кадры сериализуются orjson без пробелов)
+_CONTENT_KEY = b'"content":"'
+
+
+def _fast_extract_content(payload: bytes) -> Optional[bytes]:
+    """
+    Текст delta.content из SSE-кадра одним проходом по байтам, без разбора JSON.
+    Возвращает строку в JSON-экранировании или None, если ключ не найден.
+    """
+    i = payload.find(_CONTENT_KEY)
+    if i < 0:
+        return None
+    start = i + len(_CONTENT_KEY)
+    j = start
+    while True:
+        j = payload.find(b'"', j)
+        if j < 0:
+            return None
+        # Кавычка закрывает строку, если перед ней четное число обратных слэшей
+        k = j - 1
+        while k >= start and payload[k] == 0x5C:
+            k -= 1
+        if (j - 1 - k) % 2 == 0:
+            return payload[start:j]
+        j += 1
+
+
+# Медиа-типы потоковых ответов (сравниваются с байтами content-type до параметров)
+_STREAM_TYPES = frozenset({
+    b"text/event-stream",
+    b"application/json-seq",
+    b"application/stream+json",
+    b"application/x-ndjson",
+})
+
+# Методы, тело запроса которых попадает в лог
+_BODY_METHODS = ("POST", "PUT", "PATCH")
+
+# Стратегии логирования по пути запроса
+LOG_FULL = "full"  # Тело запроса и ответа целиком
+LOG_SUMMARY = "summary"  # Только параметры генерации и размер промпта
+LOG_SKIP = "skip"  # Запрос не логируется
+
+
+def build_log_strategies(routes: Iterable) -> Dict[str, str]:
+    """Стратегия логирования для известных путей приложения (строится один раз при старте)"""
+    strategies: Dict[str, str] = {}
+    for route in routes:
+        path = getattr(route, "path", None)
+        if path is None:
+            continue
+        if path.endswith("/chat/completions"):
+            strategies[path] = LOG_SUMMARY
+        elif "/health" in path:
+            strategies[path] = LOG_SKIP
+    return strategies
+
+
+
+class LoggingMiddleware:
+    """
+    ASGI middleware для логирования запросов и ответов.
+    Работает напрямую с сообщениями receive/send: без фоновой задачи
+    и промежуточного потока, которые создает BaseHTTPMiddleware на каждый запрос.
+    Все строки о запросе выводятся одной записью лога.
+    """
+
+    def __init__(self, app: ASGIApp, strategies: Optional[Dict[str, str]] = None):
+        self.app = app
+        self._strategies = strategies or {}
+        # Сколько байт тела ответа попадает в лог и для каких путей тело не логируется
+        self._max_body_log_bytes = settings.logging.max_body_log_bytes
+        self._skip_body_paths = tuple(settings.logging.skip_body_paths)
+        self._log_stream_content = settings.logging.log_stream_content
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Не-HTTP соединения, уровень логирования выше INFO и пропускаемые пути
+        # проходят без какой-либо обработки
+        if scope["type"] != "http" or not logger.isEnabledFor(logging.INFO):
+            await self.app(scope, receive, send)
+            return
+
+        strategy = self._strategies.get(scope["path"], LOG_FULL)
+        if strategy == LOG_SKIP:
+            await self.app(scope, receive, send)
+            return
+
+        # Идентификатор клиента переиспользуется, иначе генерируется короткий случайный.
+        # Поиск идет по сырым заголовкам: объект Headers строится только для debug-лога
+        client_request_id = next((value for key, value in scope["headers"] if key == b"x-request-id"), None)
+        request_id = client_request_id.decode("latin-1") if client_request_id else random_hex(8)
+        start_time = _perf_counter()
+
+        # Строки лога копятся и выводятся одной записью после завершения ответа
+        lines: List[str] = []
 
         # Логирование входящего запроса
-        await self._log_request(request, request_id)
+        self._log_request(scope, request_id, lines)
+        if scope["method"] in _BODY_METHODS:
+            receive = self._wrap_receive(receive, request_id, strategy, lines)
+
+        capture_body = not scope["path"].startswith(self._skip_body_paths)
+        limit = self._max_body_log_bytes
+        captured = bytearray()
+        content_buf = bytearray()  # Текст потокового ответа в UTF-8, декодируется один раз
+        total_size = 0
+        status_code = 0
+        is_streaming = False
+        is_json = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal total_size, status_code, is_streaming, is_json
 
-        # Обработка запроса
-        response = await call_next(request)
-        process_time = time.time() - start_time
+            message_type = message["type"]
+            if message_type == "http.response.start":
+                status_code = message["status"]
+                # Заголовки читаются и дополняются в исходном списке байтовых пар без обертки Headers
+                response_headers = message.setdefault("headers", [])
+                if not isinstance(response_headers, list):
+                    response_headers = message["headers"] = list(response_headers)
+                content_type = next((value for key, value in response_headers if key == b"content-type"), b"")
+                response_headers.append((b"x-request-id", request_id.encode("latin-1")))
+                is_streaming = self._is_streaming_response(content_type)
+                is_json = b"json" in content_type
+                self._log_response_start(request_id, status_code, is_streaming, _perf_counter() - start_time, lines)
 
-        # Унифицированное логирование ответа
-        return await self._log_response(request_id, response, process_time)
+            elif message_type == "http.response.body":
+                chunk = message.get("body", b"")
+                if is_streaming:
+                    if self._log_stream_content and chunk:
+                        self._collect_stream_content(request_id, chunk, content_buf)
+                elif capture_body and chunk:
+                    # Чанки уходят клиенту сразу, в лог попадают первые max_body_log_bytes байт
+                    total_size += len(chunk)
+                    if len(captured) < limit:
+                        captured.extend(chunk[:limit - len(captured)])
 
-    async def _log_request(self, request: Request, request_id: str):
+                if not message.get("more_body", False):
+                    await send(message)
+                    process_time = _perf_counter() - start_time
+                    if is_streaming:
+                        self._log_stream_completion(request_id, content_buf, process_time, lines)
+                    elif capture_body:
+                        self._log_response_body(request_id, bytes(captured), status_code, total_size, is_json, lines)
+                    return
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            logger.info("\n".join(lines))
+
+    def _log_request(self, scope: Scope, request_id: str, lines: List[str]):
         """Логирование входящего запроса"""
-        logger.info(f"Request {request_id}: {request.method} {request.url}")
-        
-        # Логирование тела запроса
-        if request.method in ["POST", "PUT", "PATCH"]:
-            await self._log_request_body(request, request_id)
-
-    async def _log_request_body(self, request: Request, request_id: str):
-        """Логирование тела запроса"""
+        query_string = scope["query_string"]
+        lines.append("Request %s: %s %s%s" % (request_id, scope["method"], scope["path"],
+                     "?" + query_string.decode("latin-1") if query_string else ""))
+
+        if logger.isEnabledFor(logging.DEBUG):
+            headers = Headers(scope=scope)
+            logger.debug("Request %s: Headers: %s", request_id,
+                         {name: headers[name] for name in LOGGED_HEADERS if name in headers})
+
+    def _wrap_receive(self, receive: Receive, request_id: str, strategy: str, lines: List[str]) -> Receive:
+        """
+        Обертка receive, которая копит тело запроса по мере чтения приложением
+        и логирует его после получения последнего чанка. Тело повторно не читается.
+        """
+        # Части тела склеиваются один раз; тело из одного сообщения не копируется вовсе.
+        # Для полного лога копятся только первые max_body_log_bytes байт,
+        # краткой сводке нужно все тело для разбора JSON
+        parts: List[bytes] = []
+        limit = None if strategy == LOG_SUMMARY else self._max_body_log_bytes
+        kept = 0
+        total_size = 0
+
+        async def receive_wrapper() -> Message:
+            nonlocal kept, total_size
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                total_size += len(chunk)
+                if limit is None:
+                    parts.append(chunk)
+                elif kept < limit:
+                    chunk = chunk[:limit - kept]
+                    kept += len(chunk)
+                    parts.append(chunk)
+                if not message.get("more_body", False):
+                    body = parts[0] if len(parts) == 1 else b"".join(parts)
+                    if strategy == LOG_SUMMARY:
+                        self._log_request_summary(request_id, body, lines)
+                    else:
+                        self._log_request_body(request_id, body, total_size, lines)
+            return message
+
+        return receive_wrapper
+
+    def _log_request_body(self, request_id: str, body: bytes, total_size: int, lines: List[str]):
+        """Логирование тела запроса (усеченного до max_body_log_bytes)"""
+        if not body:
+            return
+        if total_size > len(body):
+            lines.append("Request %s: Request body truncated to %d of %d bytes" % (request_id, len(body), total_size))
+        # JSON и текст логируются одинаково исходными байтами: разбор тела не нужен
+        lines.append("Request %s: Body: %s" % (request_id, body.decode(errors='replace')))
+
+    def _log_request_summary(self, request_id: str, body: bytes, lines: List[str]):
+        """Краткое логирование запроса генерации: параметры и размер промпта без текста сообщений"""
         try:
-            body = await request.body()
-            if body:
-                try:
-                    # Пытаемся распарсить как JSON для красивого вывода
-                    body_json = json.loads(body.decode())
-                    pretty_body = json.dumps(body_json, ensure_ascii=False, indent=2)
-                    logger.info(f"Request {request_id}: Body:\n{pretty_body}")
-                except (json.JSONDecodeError, UnicodeDecodeError):
-                    # Если не JSON или ошибка декодирования - логируем как текст
-                    decoded_body = body.decode(errors='replace')
-                    logger.info(f"Request {request_id}: Body: {decoded_body}")
-                # Восстанавливаем тело запроса
-                request._body = body
-        except Exception as e:
-            logger.error(f"Request {request_id}: Error reading request body: {str(e)}")
+            payload = _orjson_loads(body)
+            messages = payload.get("messages") or []
+            prompt_chars = sum(len(m.get("content") or "") for m in messages
+                               if isinstance(m, dict) and isinstance(m.get("content"), str))
+            lines.append("Request %s: Body summary: model=%s stream=%s max_tokens=%s messages=%d "
+                         "prompt_chars=%d tools=%d" % (
+                             request_id, payload.get("model"), payload.get("stream", False),
+                             payload.get("max_tokens"), len(messages), prompt_chars,
+                             len(payload.get("tools") or [])))
+        except (orjson.JSONDecodeError, AttributeError, TypeError):
+            lines.append("Request %s: Body: [%d bytes, not a JSON object]" % (request_id, len(body)))
+
+    def _is_streaming_response(self, content_type: bytes) -> bool:
+        """Проверка, является ли ответ потоковым (по сырому значению content-type)"""
+        if not content_type:
+            return False
+        media_type = content_type.split(b";", 1)[0].strip().lower()
+        # Известные типы проверяются по множеству, прочие потоковые - по подстроке
+        return media_type in _STREAM_TYPES or b"stream" in media_type
 
-    async def _log_response(self, request_id: str, response: Response, process_time: float):
-        """Унифицированное логирование ответа"""
-        is_streaming = self._is_streaming_response(response)
-        
+    def _log_response_start(self, request_id: str, status_code: int, is_streaming: bool, process_time: float,
+                            lines: List[str]):
+        """Логирование статуса ответа в момент отправки заголовков"""
         if is_streaming:
-            return await self._handle_streaming_response(request_id, response, process_time)
+            lines.append("Request %s: Streaming response started. Status: %s" % (request_id, status_code))
         else:
-            return await self._handle_standard_response(request_id, response, process_time)
-
-    def _is_streaming_response(self, response: Response) -> bool:
-        """Проверка, является ли ответ потоковым"""
-        content_type = response.headers.get('content-type', '').lower()
-        return (
-            isinstance(response, StreamingResponse) or 
-            'stream' in content_type or
-            'text/event-stream' in content_type or
-            'application/json-seq' in content_type
-        )
-
-    async def _handle_streaming_response(self, request_id: str, response: StreamingResponse, process_time: float):
-        """Упрощенная обработка потокового ответа с логированием полного текста"""
-        
-        # Сохраняем оригинальный итератор
-        original_iterator = response.body_iterator
-        
-        # Собираем только текстовое содержимое для логирования
-        content_parts: List[str] = []
-        
-        async def logging_iterator() -> AsyncGenerator[bytes, None]:
-            """Итератор, который собирает содержимое для логирования, но не блокирует поток"""
-            async for chunk in original_iterator:
-                yield chunk  # Сразу отдаем клиенту
-                
-                try:
-                    # Декодируем чанк и извлекаем содержимое
-                    chunk_text = chunk.decode('utf-8', errors='ignore')
-                    
-                    # Для SSE формата (data: {...})
-                    if chunk_text.startswith('data:'):
-                        try:
-                            # Извлекаем JSON из data: {...}
-                            json_str = chunk_text[5:].strip()
-                            if json_str.startswith('{') and json_str.endswith('}'):
-                                chunk_data = json.loads(json_str)
-                                # Извлекаем content из delta, если есть
-                                if (chunk_data.get('choices') and 
-                                    isinstance(chunk_data['choices'], list) and 
-                                    len(chunk_data['choices']) > 0 and
-                                    'delta' in chunk_data['choices'][0] and
-                                    'content' in chunk_data['choices'][0]['delta']):
-                                    content = chunk_data['choices'][0]['delta']['content']
-                                    if content:
-                                        content_parts.append(content)
-                        except (json.JSONDecodeError, KeyError, TypeError):
-                            pass
-                    # Для обычного текстового потока
-                    elif chunk_text.strip():
-                        content_parts.append(chunk_text.strip())
-                except Exception as e:
-                    logger.debug(f"Request {request_id}: Error processing stream chunk: {str(e)}")
-        
-        # Создаем новый ответ с нашим итератором
-        new_response = StreamingResponse(
-            logging_iterator(),
-            status_code=response.status_code,
-            headers=response.headers,
-            media_type=response.media_type,
-            background=response.background
-        )
-        
-        # Фоновая задача для логирования после завершения потока
-        async def log_completion():
-            full_content = ''.join(content_parts)
-            if full_content:
-                # Логируем полный текст без обрезания!
-                logger.info(f"Request {request_id}: Stream response content: {full_content}")
-            logger.info(f"Request {request_id}: Streaming completed. Total time: {process_time:.2f}s")
-        
-        # Добавляем фоновую задачу
-        self._add_background_task(new_response, log_completion)
-        
-        # Логируем начало потоковой передачи
-        logger.info(f"Request {request_id}: Streaming response started. Status: {response.status_code}")
-        
-        return new_response
-
-    async def _handle_standard_response(self, request_id: str, response: Response, process_time: float):
-        """Обработка стандартного ответа"""
+            lines.append("Request %s: Response status: %s" % (request_id, status_code))
+            lines.append("Request %s: Process time: %.2fs" % (request_id, process_time))
+
+    def _collect_stream_content(self, request_id: str, chunk: bytes, content_buf: bytearray):
+        """
+        Извлечение текстового содержимого из чанка потокового ответа.
+        Буфер хранит текст в JSON-экранировании: он раскодируется один раз при выводе в лог.
+        """
         try:
-            # Читаем всё тело ответа
-            response_body = b""
-            async for chunk in response.body_iterator:
-                response_body += chunk
-
-            # Логируем тело ответа
-            await self._log_response_body(request_id, response_body, response.status_code)
-
-            # Восстанавливаем итератор
-            async def new_body_iterator():
-                yield response_body
-            
-            response.body_iterator = new_body_iterator()
-            
+            # Для SSE формата (data: {...}) проверка и разбор идут по байтам без декодирования чанка
+            if chunk.startswith(_SSE_PREFIX):
+                content = _fast_extract_content(chunk)
+                if content is not None:
+                    content_buf.extend(content)
+                    return
+                try:
+                    # Кадр другой формы: извлекаем JSON из data: {...} и разбираем целиком
+                    payload = chunk[5:].strip()
+                    if payload.startswith(b'{') and payload.endswith(b'}'):
+                        chunk_data = _orjson_loads(payload)
+                        # Извлекаем content из delta, если есть
+                        if (chunk_data.get('choices') and
+                            isinstance(chunk_data['choices'], list) and
+                            len(chunk_data['choices']) > 0 and
+                            'delta' in chunk_data['choices'][0] and
+                            'content' in chunk_data['choices'][0]['delta']):
+                            content = chunk_data['choices'][0]['delta']['content']
+                            if content:
+                                content_buf.extend(orjson.dumps(content)[1:-1])
+                except (orjson.JSONDecodeError, KeyError, TypeError):
+                    pass
+            # Для обычного текстового потока
+            else:
+                content_buf.extend(orjson.dumps(chunk.strip().decode('utf-8', errors='replace'))[1:-1])
         except Exception as e:
-            logger.error(f"Request {request_id}: Error reading response body: {str(e)}")
+            logger.debug("Request %s: Error processing stream chunk: %s", request_id, e)
 
-        logger.info(f"Request {request_id}: Response status: {response.status_code}")
-        logger.info(f"Request {request_id}: Process time: {process_time:.2f}s")
-        return response
+    def _log_stream_completion(self, request_id: str, content_buf: bytearray, process_time: float,
+                               lines: List[str]):
+        """Логирование завершения потокового ответа"""
+        if content_buf:
+            # Экранирование JSON снимается один раз для всего текста
+            try:
+                full_content = _orjson_loads(b'"' + content_buf + b'"')
+            except orjson.JSONDecodeError:
+                full_content = content_buf.decode('utf-8', errors='replace')
+            # Логируем полный текст без обрезания!
+            lines.append("Request %s: Stream response content: %s" % (request_id, full_content))
+        lines.append("Request %s: Streaming completed. Total time: %.2fs" % (request_id, process_time))
 
-    async def _log_response_body(self, request_id: str, response_body: bytes, status_code: int):
-        """Логирование тела ответа с поддержкой полного текста"""
+    def _log_response_body(self, request_id: str, response_body: bytes, status_code: int, total_size: int,
+                           is_json: bool, lines: List[str]):
+        """
+        Логирование тела ответа (усеченного до max_body_log_bytes).
+        Тип тела берется из content-type ответа: JSON не разбирается ради подписи в логе.
+        """
         if not response_body:
-            logger.info(f"Request {request_id}: Response body: [Empty]")
+            lines.append("Request %s: Response body: [Empty]" % request_id)
             return
-            
-        try:
-            decoded_body = response_body.decode('utf-8', errors='replace')
-            
-            # Проверяем, является ли это JSON
-            try:
-                json_obj = json.loads(decoded_body)
-                # Для ошибок или обычных JSON ответов
-                if status_code >= 400 or not self._contains_stream_data(json_obj):
-                    pretty_json = json.dumps(json_obj, indent=2, ensure_ascii=False)
-                    logger.info(f"Request {request_id}: Response body (JSON):\n{pretty_json}")
-                else:
-                    # Это успешный JSON, но не потоковый - логируем как текст
-                    logger.info(f"Request {request_id}: Response body: {decoded_body}")
-            except (json.JSONDecodeError, TypeError):
-                # Обычный текст
-                logger.info(f"Request {request_id}: Response body: {decoded_body}")
-        except UnicodeDecodeError:
-            logger.info(f"Request {request_id}: Response body: [Binary data - {len(response_body)} bytes]")
-
-    def _contains_stream_data(self, data: any) -> bool:
-        """Проверка, содержит ли JSON данные о потоковой передаче"""
-        if isinstance(data, dict):
-            # Проверяем наличие полей, характерных для чанков потоковых ответов
-            return ('choices' in data and 
-                    isinstance(data['choices'], list) and 
-                    len(data['choices']) > 0 and
-                    'delta' in data['choices'][0])
-        return False
-
-    def _add_background_task(self, response: Response, task_func: callable):
-        """Унифицированное добавление фоновой задачи к ответу"""
-        async def wrapper():
-            await task_func()
-        
-        if response.background:
-            original_background = response.background
-            async def combined_task():
-                await original_background()
-                await wrapper()
-            response.background = BackgroundTask(combined_task)
+
+        if total_size > len(response_body):
+            lines.append("Request %s: Response body truncated to %d of %d bytes" % (request_id, len(response_body), total_size))
+
+        decoded_body = response_body.decode('utf-8', errors='replace')
+        # Для ошибок или обычных JSON ответов (исходный текст логируется без повторной сериализации)
+        if is_json and (status_code >= 400 or not self._contains_stream_data(response_body)):
+            lines.append("Request %s: Response body (JSON): %s" % (request_id, decoded_body))
         else:
-            response.background = BackgroundTask(wrapper)
\ No newline at end of file
+            # Текст или JSON с чанками потоковой передачи
+            lines.append("Request %s: Response body: %s" % (request_id, decoded_body))
+
+    def _contains_stream_data(self, body: bytes) -> bool:
+        """Проверка, содержит ли JSON данные о потоковой передаче (поле delta в choices)"""
+        return b'"choices"' in body and b'"delta"' in body
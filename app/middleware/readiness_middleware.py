@@ -0,0 +1,33 @@
+from starlette.types import ASGIApp, Receive, Scope, Send
+from fastapi.responses import ORJSONResponse
+from typing import Iterable
+
+# Рекомендуемая пауза перед повтором, пока модель загружается
+_RETRY_AFTER_SECONDS = "5"
+
+
+class ReadinessMiddleware:
+    """
+    ASGI middleware, которое отклоняет запросы с 503 и Retry-After,
+    пока сервис не инициализирован (app.state.ready). Балансировщик сразу
+    получает отказ вместо ожидания в очереди соединений.
+    Пробы здоровья и документация доступны всегда.
+    """
+
+    def __init__(self, app: ASGIApp, exempt_paths: Iterable[str] = ()):
+        self.app = app
+        self._exempt_paths = tuple(exempt_paths)
+        self._not_ready_response = ORJSONResponse(
+            {"detail": "Service is initializing. Please try again later."},
+            status_code=503,
+            headers={"Retry-After": _RETRY_AFTER_SECONDS},
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (scope["type"] != "http"
+                or getattr(scope["app"].state, "ready", False)
+                or scope["path"].startswith(self._exempt_paths)):
+            await self.app(scope, receive, send)
+            return
+
+        await self._not_ready_response(scope, receive, send)
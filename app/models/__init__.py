@@ -5,25 +5,45 @@ Pydantic models module.
 from .schemas import (
     ChatCompletionRequest,
     ChatCompletionResponse,
+    ChatCompletionResponseChoice,
     ChatCompletionChunk,
+    ChatCompletionChunkChoice,
+    UsageInfo,
     HealthResponse,
     ModelsListResponse,
     Message,
+    MESSAGES_ADAPTER,
+    SystemMessage,
+    UserMessage,
+    AssistantMessage,
+    ToolMessage,
+    FunctionMessage,
     ToolCall,
     FunctionCall,
     ToolDefinition,
+    FunctionDefinition,
     MessageRole
 )
 
 __all__ = [
     "ChatCompletionRequest",
     "ChatCompletionResponse",
+    "ChatCompletionResponseChoice",
     "ChatCompletionChunk",
+    "ChatCompletionChunkChoice",
+    "UsageInfo",
     "HealthResponse",
     "ModelsListResponse",
     "Message",
+    "MESSAGES_ADAPTER",
+    "SystemMessage",
+    "UserMessage",
+    "AssistantMessage",
+    "ToolMessage",
+    "FunctionMessage",
     "ToolCall",
     "FunctionCall",
     "ToolDefinition",
+    "FunctionDefinition",
     "MessageRole"
-]
\ No newline at end of file
+]
@@ -1,26 +1,34 @@
-from pydantic import BaseModel, Field, field_validator
-from typing import List, Optional, Literal, Dict, Any, Union
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, field_validator
+from typing import Annotated, List, Optional, Literal, Dict, Any, Union
 from enum import Enum
-import json
 import logging
+import orjson
 
 logger = logging.getLogger(__name__) 
 
 class FunctionCall(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     name: str = Field(..., description="Название вызываемой функции")
     arguments: str = Field(..., description="Аргументы функции в формате JSON строки")
 
 class ToolCall(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     id: str = Field(..., description="Уникальный идентификатор вызова инструмента")
     type: Literal["function"] = "function"
     function: FunctionCall
 
 class FunctionDefinition(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     name: str = Field(..., description="Название функции")
     description: Optional[str] = Field(None, description="Описание функции")
     parameters: Optional[Dict[str, Any]] = Field(None, description="JSON Schema параметров функции")
 
 class ToolDefinition(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     type: Literal["function"] = "function"
     function: FunctionDefinition
 
@@ -34,10 +42,14 @@ class MessageRole(str, Enum):
 # === Базовые классы для каждого типа сообщений ===
 
 class SystemMessage(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     role: Literal[MessageRole.SYSTEM] = MessageRole.SYSTEM
     content: str
 
 class UserMessage(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     role: Literal[MessageRole.USER] = MessageRole.USER
     content: Union[str, List[Dict[str, Any]]]
 
@@ -54,12 +66,16 @@ class UserMessage(BaseModel):
         return v
 
 class AssistantMessage(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     role: Literal[MessageRole.ASSISTANT] = MessageRole.ASSISTANT
     content: Optional[str] = None
     tool_calls: Optional[List[ToolCall]] = None
 
 class ToolMessage(BaseModel):
     """Строгое определение для tool-сообщений"""
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     role: Literal[MessageRole.TOOL] = MessageRole.TOOL
     content: str  # JSON-строка с оригинальной структурой MCP
     tool_call_id: str
@@ -69,45 +85,58 @@ class ToolMessage(BaseModel):
     @classmethod
     def convert_to_json_string(cls, v: Any) -> str:
         """Конвертируем content в JSON-строку с сохранением структуры MCP"""
-        import json
-        
         # Если это уже строка, проверяем не JSON ли это
         if isinstance(v, str):
-            try:
-                # Если это валидный JSON, оставляем как есть
-                json.loads(v)
-                return v
-            except json.JSONDecodeError:
-                # Если это простая строка, оборачиваем в MCP структуру
-                return json.dumps([{"type": "text", "text": v}], ensure_ascii=False)
-        
+            # Структура MCP - объект или массив: остальные строки оборачиваются без разбора
+            if v.lstrip()[:1] in ('{', '['):
+                try:
+                    # Если это валидный JSON, оставляем как есть
+                    orjson.loads(v)
+                    return v
+                except orjson.JSONDecodeError:
+                    pass
+            # Если это простая строка, оборачиваем в MCP структуру
+            return orjson.dumps([{"type": "text", "text": v}]).decode()
+
         # Если это список (оригинальный MCP формат)
         elif isinstance(v, list):
             # Сериализуем весь список в JSON строку
             try:
-                return json.dumps(v, ensure_ascii=False)
-            except Exception as e:
-                logger.error(f"Failed to serialize MCP content to JSON: {e}")
+                return orjson.dumps(v).decode()
+            except TypeError as e:
+                logger.error("Failed to serialize MCP content to JSON: %s", e)
                 # Fallback: пытаемся извлечь текст
                 text_parts = []
                 for item in v:
                     if isinstance(item, dict) and item.get("type") == "text" and "text" in item:
                         text_parts.append(str(item.get("text", "")))
-                return json.dumps([{"type": "text", "text": "".join(text_parts)}], ensure_ascii=False)
-        
+                return orjson.dumps([{"type": "text", "text": "".join(text_parts)}]).decode()
+
         # Для других типов - преобразуем в текст и оборачиваем
         else:
-            return json.dumps([{"type": "text", "text": str(v)}], ensure_ascii=False)
+            return orjson.dumps([{"type": "text", "text": str(v)}]).decode()
 
 class FunctionMessage(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     role: Literal[MessageRole.FUNCTION] = MessageRole.FUNCTION
     content: str
     name: str
 
 # === Union тип для аннотации ===
-Message = Union[SystemMessage, UserMessage, AssistantMessage, ToolMessage, FunctionMessage]
+# Класс сообщения выбирается по полю role сразу, без перебора всех вариантов объединения
+Message = Annotated[
+    Union[SystemMessage, UserMessage, AssistantMessage, ToolMessage, FunctionMessage],
+    Field(discriminator="role"),
+]
+
+# Валидатор списка сообщений строится один раз при импорте и переиспользуется
+MESSAGES_ADAPTER = TypeAdapter(List[Message])
 
 class ChatCompletionRequest(BaseModel):
+    # Запрос не изменяется после валидации: замораживаем и игнорируем лишние поля
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     model: str = "abstract-model"
     messages: List[Message]  # Используем Union тип
     temperature: Optional[float] = Field(0.7, ge=0, le=2)
@@ -129,6 +158,8 @@ class UsageInfo(BaseModel):
     total_tokens: int
 
 class ChatCompletionResponse(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     id: str
     object: str = "chat.completion"
     created: int
@@ -142,6 +173,8 @@ class ChatCompletionChunkChoice(BaseModel):
     finish_reason: Optional[str] = None
 
 class ChatCompletionChunk(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     id: str
     object: str = "chat.completion.chunk"
     created: int
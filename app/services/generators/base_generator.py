@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from typing import List, Optional, Dict, Any, Callable
-from app.models.schemas import AssistantMessage, FunctionMessage, Message, ToolDefinition, ToolMessage
+from app.models.schemas import MESSAGES_ADAPTER, Message, ToolDefinition
 from app.services.generators.tool_call_processor import ToolCallProcessor
 import logging
 
@@ -29,38 +29,16 @@ class BaseResponseGenerator(ABC):
         """Абстрактный метод генерации"""
         pass
 
-    def _should_use_tools(self, tools: Optional[List[ToolDefinition]]) -> bool:
-        """Проверка необходимости использования инструментов"""
-        return tools is not None and len(tools) > 0
-
     def _convert_messages_to_dict(self, messages: List[Message]) -> List[Dict[str, Any]]:
-        """Конвертация сообщений в словари"""
-        result = []
-        for message in messages:
-            # Базовый словарь для всех сообщений
-            message_dict = {
-                "role": message.role.value,
-                "content": message.content
-            }
-            
-            # Особые поля для разных типов сообщений
-            if isinstance(message, AssistantMessage) and message.tool_calls:
-                message_dict["tool_calls"] = [
-                    {
-                        "id": tool_call.id,
-                        "type": tool_call.type,
-                        "function": {
-                            "name": tool_call.function.name,
-                            "arguments": tool_call.function.arguments
-                        }
-                    }
-                    for tool_call in message.tool_calls
-                ]
-            elif isinstance(message, ToolMessage):
-                message_dict["tool_call_id"] = message.tool_call_id
-            
-            result.append(message_dict)
-
+        """
+        Конвертация сообщений в словари одним вызовом общего сериализатора списка.
+        content присутствует всегда (форматтеры llama_cpp читают message["content"]),
+        пустой tool_calls в словарь не попадает.
+        """
+        result = MESSAGES_ADAPTER.dump_python(messages, mode="json")
+        for message_dict in result:
+            if "tool_calls" in message_dict and message_dict["tool_calls"] is None:
+                del message_dict["tool_calls"]
         return result
 
     def _prepare_generation_params(
@@ -70,13 +48,13 @@ class BaseResponseGenerator(ABC):
             max_tokens: int,
             frequency_penalty: float,
             presence_penalty: float,
-            tools: Optional[List[ToolDefinition]]
+            tools: Optional[List[ToolDefinition]],
+            use_tools: bool
     ) -> Dict[str, Any]:
-        """Подготовка параметров генерации"""
-        logger.info(f"Preparing generation params for {self.__class__.__name__}")
+        """Подготовка параметров генерации (use_tools вычисляется один раз в generate)"""
+        logger.debug("Preparing generation params for %s", self.__class__.__name__)
 
         messages_dict = self._convert_messages_to_dict(messages)
-        logger.info(f"Messages dict: {messages_dict}")
 
         params = {
             "messages": messages_dict,
@@ -87,9 +65,12 @@ class BaseResponseGenerator(ABC):
         }
 
         # Добавляем инструменты, если они переданы (без tool_choice!)
-        if self._should_use_tools(tools):
+        if use_tools:
             params["tools"] = [tool.model_dump() for tool in tools]
-            logger.info(f"Tools enabled: {[tool.function.name for tool in tools]}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Tools enabled: %s", [tool.function.name for tool in tools])
 
-        logger.info(f"Completion params: {params}")
+        # Полный дамп промпта и инструментов (десятки КБ на длинных диалогах) - только в DEBUG
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Completion params: %s", params)
         return params
\ No newline at end of file
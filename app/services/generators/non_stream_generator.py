@@ -1,11 +1,15 @@
+import asyncio
 import time
-import uuid
-from typing import List, Optional
+from typing import Dict, List, Optional
 from app.models.schemas import (
     Message, ToolDefinition, ChatCompletionResponse,
-    UsageInfo, MessageRole, ChatCompletionResponseChoice, AssistantMessage
+    UsageInfo, ChatCompletionResponseChoice, AssistantMessage, ToolCall
 )
+from app.exceptions import ServiceUnavailableError
+from app.core.ids import random_hex
+from app.services.response_cache import get_response_cache
 from .base_generator import BaseResponseGenerator
+from .tool_call_processor import TOOL_CALL_OPEN
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,6 +18,13 @@ logger = logging.getLogger(__name__)
 class NonStreamResponseGenerator(BaseResponseGenerator):
     """Генератор не-потоковых ответов"""
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Кэш готовых ответов (None, если кэширование выключено)
+        self._response_cache = get_response_cache()
+        # Выполняющиеся сейчас запросы: ключ параметров -> Future с готовым ответом
+        self._inflight: Dict[str, asyncio.Future] = {}
+
     async def generate(
             self,
             messages: List[Message],
@@ -27,98 +38,160 @@ class NonStreamResponseGenerator(BaseResponseGenerator):
         """Генерация не-потокового ответа"""
         logger.info("Starting non-stream generation")
 
-        start_time = time.time()
-        response_id = f"chatcmpl-{uuid.uuid4().hex}"
+        start_time = time.perf_counter()
+        response_id = f"chatcmpl-{random_hex()}"
+        use_tools = bool(tools)
 
         try:
             # Подготавливаем параметры
             params = self._prepare_generation_params(
-                messages, temperature, max_tokens, frequency_penalty, presence_penalty, tools
+                messages, temperature, max_tokens, frequency_penalty, presence_penalty, tools, use_tools
             )
 
-            logger.info(f"Calling model completion for session {session_id}")
-
-            # Вызываем completion с session_id через _completion_caller
-            response = await self._completion_caller(session_id, **params)
-            logger.info(f"Model response received, processing...")
-
-            # Обрабатываем ответ
-            processed_response = self._process_response(response, tools, response_id)
-
-            processing_time = time.time() - start_time
-            logger.info(f"Non-stream response generated in {processing_time:.2f}s")
+            # Повторный запрос с теми же параметрами обслуживается без обращения к модели
+            cache = self._response_cache
+            # Кэш и объединение одинаковых запросов включаются настройкой caching.enabled
+            cacheable = cache is not None and cache.accepts(temperature)
+            request_key = None
+            if cacheable:
+                request_key = cache.make_key(self.model_name, params)
+                cached_response = cache.get(request_key)
+                if cached_response is not None:
+                    logger.info("Non-stream response served from cache")
+                    return cached_response.model_copy(update={"id": response_id})
+
+            # Такой же запрос уже выполняется: ждем его ответ вместо второго вызова модели
+            if request_key is not None:
+                leader = self._inflight.get(request_key)
+                if leader is not None:
+                    logger.info("Joining identical in-flight request")
+                    shared_response = await asyncio.shield(leader)
+                    return shared_response.model_copy(update={"id": response_id})
+                future = asyncio.get_running_loop().create_future()
+                self._inflight[request_key] = future
+
+            try:
+                logger.info("Calling model completion for session %s", session_id)
+
+                # Вызываем completion с session_id через _completion_caller
+                response = await self._completion_caller(session_id, params)
+                logger.info("Model response received, processing...")
+
+                # Обрабатываем ответ
+                processed_response = self._process_response(response, use_tools, response_id)
+                # Кэшируются только корректные ответы модели (не ответы об ошибке)
+                if request_key is not None and response and response.get('choices'):
+                    cache.put(request_key, processed_response)
+            except BaseException as e:
+                if request_key is not None:
+                    self._release_inflight(request_key, exc=e)
+                raise
+            if request_key is not None:
+                self._release_inflight(request_key, result=processed_response)
+
+            processing_time = time.perf_counter() - start_time
+            logger.info("Non-stream response generated in %.2fs", processing_time)
 
             return processed_response
 
+        except ServiceUnavailableError:
+            # Занятость пула обрабатывается на уровне API (HTTP 503)
+            raise
         except Exception as e:
-            logger.error(f"Non-stream generation error: {str(e)}", exc_info=True)
+            logger.error("Non-stream generation error: %s", e, exc_info=True)
             return self._create_error_response(response_id, str(e))
 
+    def _release_inflight(self, request_key: str, result=None, exc: Optional[BaseException] = None) -> None:
+        """Передает результат (или ошибку) ожидающим запросам и снимает запись"""
+        future = self._inflight.pop(request_key, None)
+        if future is None or future.done():
+            return
+        if exc is None:
+            future.set_result(result)
+            return
+        if isinstance(exc, ServiceUnavailableError):
+            # Как и ведущий запрос, ожидающие получают 503
+            future.set_exception(exc)
+        elif isinstance(exc, Exception):
+            # Ведущий запрос отвечает ответом с ошибкой (200): ожидающие получают такой же
+            future.set_result(self._create_error_response(request_key, str(exc)))
+            return
+        else:
+            # Ведущий запрос отменен (клиент ушел), ответа нет:
+            # ожидающие получают 503 и повторяют запрос сами
+            future.set_exception(ServiceUnavailableError("Identical in-flight request was cancelled"))
+        # Исключение помечается полученным, чтобы не было предупреждения при отсутствии ожидающих
+        future.exception()
+
     def _process_response(
             self,
             response: dict,
-            tools: Optional[List[ToolDefinition]],
+            use_tools: bool,
             response_id: str
     ) -> ChatCompletionResponse:
         """Обрабатывает raw response от модели"""
         if not response or 'choices' not in response or not response['choices']:
             return self._create_error_response(response_id, "Invalid response from model")
 
-        choices_data = response.get('choices', [{}])[0]
-        message_data = choices_data.get('message', {})
-        finish_reason = choices_data.get('finish_reason', 'stop')
+        choice = response['choices'][0]
+        message_data = choice.get('message', {})
+        finish_reason = choice.get('finish_reason', 'stop')
         content = message_data.get('content', '')
         tool_calls = message_data.get('tool_calls')
 
         # Обрабатываем tool calls только если они переданы и контент содержит теги
-        if self._should_use_tools(tools) and content and '<tool_call>' in content:
+        if use_tools and content and TOOL_CALL_OPEN in content:
             cleaned_content, extracted_tool_calls = self.tool_processor.extract_tool_calls(content)
             if extracted_tool_calls:
                 content = cleaned_content.strip() if cleaned_content else None
                 tool_calls = extracted_tool_calls
                 finish_reason = "tool_calls"
-                logger.info(f"Extracted {len(extracted_tool_calls)} tool calls from text")
-
-        # Создаем сообщение ассистента
-        assistant_message = AssistantMessage(
-            role=MessageRole.ASSISTANT,
-            content=content if content else None,
-            tool_calls=tool_calls if tool_calls else None
-        )
-
-        return ChatCompletionResponse(
-            id=response.get('id', response_id),
+                logger.info("Extracted %d tool calls from text", len(extracted_tool_calls))
+
+        # Поля ответа сформированы здесь и корректны по построению: модели собираются
+        # через model_construct без повторной валидации. Исключение - tool_calls,
+        # которые вернула сама модель в виде словарей
+        if tool_calls and not isinstance(tool_calls[0], ToolCall):
+            assistant_message = AssistantMessage(content=content or None, tool_calls=tool_calls)
+        else:
+            assistant_message = AssistantMessage.model_construct(content=content or None, tool_calls=tool_calls or None)
+
+        # Время запрашивается только если модель его не вернула
+        created = response.get('created') or int(time.time())
+        usage = response.get('usage') or {}
+
+        return ChatCompletionResponse.model_construct(
+            id=response.get('id') or response_id,
             object="chat.completion",
-            created=response.get('created', int(time.time())),
+            created=created,
             model=self.model_name,
             choices=[
-                ChatCompletionResponseChoice(
+                ChatCompletionResponseChoice.model_construct(
                     index=0,
                     message=assistant_message,
                     finish_reason=finish_reason
                 )],
-            usage=UsageInfo(
-                prompt_tokens=response.get('usage', {}).get('prompt_tokens', 0),
-                completion_tokens=response.get('usage', {}).get('completion_tokens', 0),
-                total_tokens=response.get('usage', {}).get('total_tokens', 0)
+            usage=UsageInfo.model_construct(
+                prompt_tokens=usage.get('prompt_tokens', 0),
+                completion_tokens=usage.get('completion_tokens', 0),
+                total_tokens=usage.get('total_tokens', 0)
             )
         )
 
     def _create_error_response(self, response_id: str, error_message: str) -> ChatCompletionResponse:
         """Создает ответ с ошибкой"""
-        return ChatCompletionResponse(
+        return ChatCompletionResponse.model_construct(
             id=response_id,
             object="chat.completion",
             created=int(time.time()),
             model=self.model_name,
             choices=[
-                ChatCompletionResponseChoice(
+                ChatCompletionResponseChoice.model_construct(
                     index=0,
-                    message=AssistantMessage(
-                        role=MessageRole.ASSISTANT,
+                    message=AssistantMessage.model_construct(
                         content=f"Error: {error_message}"
                     ),
                     finish_reason="stop"
                 )],
-            usage=UsageInfo(prompt_tokens=0, completion_tokens=0, total_tokens=0)
-        )
\ No newline at end of file
+            usage=UsageInfo.model_construct(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+        )
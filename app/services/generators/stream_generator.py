@@ -1,24 +1,43 @@
-import json
 import time
-import uuid
-import re
-from typing import List, Optional, AsyncGenerator, Dict, Any
+import orjson
+from typing import List, Optional, AsyncGenerator, Dict, Any, Iterator
 
 from app.models.schemas import Message, ToolDefinition
+from app.core.ids import random_hex
 from .base_generator import BaseResponseGenerator
-from app.services.generators.tool_call_processor import ToolCallProcessor
+from .tool_call_processor import (
+    TOOL_CALL_OPEN as _TOOL_CALL_OPEN, TOOL_CALL_CLOSE as _TOOL_CALL_CLOSE, iter_tool_call_spans
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Окончание кадра после delta
+_CHUNK_SUFFIX = b',"finish_reason":null}]}\n\n'
+# Текстовый кадр: delta {"content":...} собирается из шаблона, сериализуется только строка
+_CONTENT_DELTA_PREFIX = b'{"content":'
+_CONTENT_CHUNK_SUFFIX = b'}' + _CHUNK_SUFFIX
+# Кадр с ошибкой: delta {"role":"assistant","content":"Error: ..."} и finish_reason "stop"
+_ERROR_DELTA_PREFIX = b'{"role":"assistant","content":'
+_ERROR_CHUNK_SUFFIX = b'},"finish_reason":"stop"}]}\n\n'
+# Окончание последнего кадра вызова инструмента
+_TOOL_CALLS_FINISH_SUFFIX = b',"finish_reason":"tool_calls"}]}\n\n'
+
+# Размер части аргументов вызова инструмента в одном кадре, символов
+_TOOL_ARGS_CHUNK = 256
+# delta кадра с продолжением аргументов: {"tool_calls":[{"index":0,"function":{"arguments":...}}]}
+_TOOL_ARGS_DELTA_PREFIX = b'{"tool_calls":[{"index":0,"function":{"arguments":'
+_TOOL_ARGS_DELTA_SUFFIX = b'}}]}'
+
 
 class StreamResponseGenerator(BaseResponseGenerator):
     """Генератор потоковых ответов с поддержкой tool calls для LibreChat"""
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.tool_processor = ToolCallProcessor()
-        self.tool_call_pattern = re.compile(r'<tool_call>\s*(.*?)\s*</tool_call>', re.DOTALL)
+        # Часть кадра от имени модели до delta одинакова для всех потоков генератора
+        self._model_json = orjson.dumps(self.model_name)
+        self._chunk_prefix_tail = b',"model":' + self._model_json + b',"choices":[{"index":0,"delta":'
 
     async def generate(
         self,
@@ -29,143 +48,125 @@ class StreamResponseGenerator(BaseResponseGenerator):
         presence_penalty: float,
         tools: Optional[List[ToolDefinition]] = None,
         session_id: str = None,
-    ) -> AsyncGenerator[str, None]:
-        logger.info(f"Streaming generation started [Session: {session_id}]")
-        response_id = f"chatcmpl-{uuid.uuid4().hex}"
-
-        buffer = ""
+    ) -> AsyncGenerator[bytes, None]:
+        logger.info("Streaming generation started [Session: %s]", session_id)
+        response_id = f"chatcmpl-{random_hex()}"
+        # Время создания и общая часть кадра вычисляются один раз на поток
+        created = int(time.time())
+        chunk_prefix = self._chunk_prefix(response_id, created)
+        content_prefix = chunk_prefix + _CONTENT_DELTA_PREFIX
+
+        # Текст вызова инструмента копится частями и склеивается один раз при закрытии тега
+        buffer_parts: List[str] = []
+        tail = ""  # Хвост предыдущего текста: закрывающий тег может прийти в двух чанках
         tool_call_detected = False
 
+        # Атрибуты, нужные на каждом токене, читаются в локальные переменные один раз
+        create_chunk = self._create_chunk
+        completion_caller = self._completion_caller
+        # Без инструментов в запросе поиск тегов вызова не выполняется вовсе
+        use_tools = bool(tools)
+
         try:
             params = self._prepare_generation_params(
-                messages, temperature, max_tokens, frequency_penalty, presence_penalty, tools
+                messages, temperature, max_tokens, frequency_penalty, presence_penalty, tools, use_tools
             )
 
-            async for chunk in self._completion_caller(session_id, **params):
+            async for chunk in completion_caller(session_id, params):
                 delta = chunk.get('choices', [{}])[0].get('delta', {})
                 content = delta.get('content', '')
 
                 if not content:
                     continue
 
-                if not tool_call_detected and '<tool_call>' not in content:
+                if not use_tools or (not tool_call_detected and _TOOL_CALL_OPEN not in content):
                     # Обычный текст
-                    yield self._create_chunk(response_id, content)
+                    yield create_chunk(content_prefix, content)
                 else:
                     # Tool call detection
-                    buffer += content
+                    buffer_parts.append(content)
                     tool_call_detected = True
 
-                    if '</tool_call>' in buffer:
-                        tool_calls = self._parse_tool_calls_from_buffer(buffer)
+                    if _TOOL_CALL_CLOSE in tail + content:
+                        tool_calls = self._parse_tool_calls_from_buffer(''.join(buffer_parts))
                         if tool_calls:
                             # Генерируем последовательность как OpenAI
-                            async for tool_chunk in self._stream_tool_calls(response_id, tool_calls[0]):
+                            for tool_chunk in self._stream_tool_calls(chunk_prefix, tool_calls[0]):
                                 yield tool_chunk
-                        buffer = ""
+                        buffer_parts.clear()
+                        tail = ""
                         tool_call_detected = False
+                    else:
+                        tail = (tail + content)[-(len(_TOOL_CALL_CLOSE) - 1):]
 
-            if buffer and not tool_call_detected:
-                yield self._create_chunk(response_id, buffer)
+            if buffer_parts and not tool_call_detected:
+                yield create_chunk(content_prefix, ''.join(buffer_parts))
 
-            yield "data: [DONE]\n\n"
+            yield b"data: [DONE]\n\n"
 
         except Exception as e:
-            logger.error(f"Streaming error: {str(e)}", exc_info=True)
-            yield self._create_error_chunk(response_id, str(e))
-
-    async def _stream_tool_calls(self, response_id: str, tool_call: dict) -> AsyncGenerator[str, None]:
-        """Строгая имитация OpenAI streaming для LibreChat"""
-        
-        # Чанк 1: role + инициализация tool call
-        yield f"data: {json.dumps({
-            'id': response_id,
-            'object': 'chat.completion.chunk',
-            'created': int(time.time()),
-            'model': self.model_name,
-            'choices': [{
-                'index': 0,
-                'delta': {
-                    'role': 'assistant',
-                    'tool_calls': [{
-                        'index': 0,
-                        'id': tool_call['id'],
-                        'type': 'function',
-                        'function': {'name': tool_call['function']['name'], 'arguments': ''}
-                    }]
-                },
-                'finish_reason': None
-            }]
-        }, ensure_ascii=False)}\n\n"
-
-        # Чанк 2: аргументы (разбиваем на части для больших ответов)
+            logger.error("Streaming error: %s", e, exc_info=True)
+            yield self._create_error_chunk(response_id, created, str(e))
+
+    def _stream_tool_calls(self, chunk_prefix: bytes, tool_call: dict) -> Iterator[bytes]:
+        """
+        Строгая имитация OpenAI streaming для LibreChat.
+        Аргументы отправляются частями по _TOOL_ARGS_CHUNK символов: первая часть
+        идет в кадре с role и инициализацией вызова, finish_reason - в последнем кадре.
+        """
         args = tool_call['function']['arguments']
-        # Для простоты отправляем за 2 чанка
-        mid = len(args) // 2
-        if mid > 0:
-            yield f"data: {json.dumps({
-                'id': response_id,
-                'object': 'chat.completion.chunk',
-                'created': int(time.time()),
-                'model': self.model_name,
-                'choices': [{
-                    'index': 0,
-                    'delta': {'tool_calls': [{'index': 0, 'function': {'arguments': args[:mid]}}]},
-                    'finish_reason': None
-                }]
-            }, ensure_ascii=False)}\n\n"
-            
-        # Чанк 3: остаток аргументов + finish_reason
-        yield f"data: {json.dumps({
-            'id': response_id,
-            'object': 'chat.completion.chunk',
-            'created': int(time.time()),
-            'model': self.model_name,
-            'choices': [{
+        last = max(len(args) - 1, 0) // _TOOL_ARGS_CHUNK * _TOOL_ARGS_CHUNK
+
+        # Кадр 1: role + инициализация tool call + первая часть аргументов
+        yield chunk_prefix + orjson.dumps({
+            'role': 'assistant',
+            'tool_calls': [{
                 'index': 0,
-                'delta': {'tool_calls': [{'index': 0, 'function': {'arguments': args[mid:]}}]},
-                'finish_reason': 'tool_calls'  # ВАЖНО: здесь!
+                'id': tool_call['id'],
+                'type': 'function',
+                'function': {'name': tool_call['function']['name'], 'arguments': args[:_TOOL_ARGS_CHUNK]}
             }]
-        }, ensure_ascii=False)}\n\n"
-
-    def _create_chunk(self, response_id: str, content: str) -> str:
-        return f"data: {json.dumps({
-            'id': response_id,
-            'object': 'chat.completion.chunk',
-            'created': int(time.time()),
-            'model': self.model_name,
-            'choices': [{'index': 0, 'delta': {'content': content}, 'finish_reason': None}]
-        }, ensure_ascii=False)}\n\n"
-
-    def _create_error_chunk(self, response_id: str, error_message: str) -> str:
+        }) + (_TOOL_CALLS_FINISH_SUFFIX if last == 0 else _CHUNK_SUFFIX)
+
+        # Остальные части аргументов; в последнем кадре finish_reason (ВАЖНО: здесь!)
+        for i in range(_TOOL_ARGS_CHUNK, last + 1, _TOOL_ARGS_CHUNK):
+            # Обертка delta неизменна: сериализуется только строка с частью аргументов
+            yield (chunk_prefix + _TOOL_ARGS_DELTA_PREFIX + orjson.dumps(args[i:i + _TOOL_ARGS_CHUNK])
+                   + _TOOL_ARGS_DELTA_SUFFIX + (_TOOL_CALLS_FINISH_SUFFIX if i == last else _CHUNK_SUFFIX))
+
+    def _chunk_prefix(self, response_id: str, created: int) -> bytes:
+        """Неизменная в пределах потока часть кадра: до значения delta"""
+        return (b'data: {"id":' + orjson.dumps(response_id)
+                + b',"object":"chat.completion.chunk","created":' + str(created).encode()
+                + self._chunk_prefix_tail)
+
+    def _create_chunk(self, content_prefix: bytes, content: str) -> bytes:
+        """Текстовый кадр: из всего кадра сериализуется только строка с новым текстом"""
+        return content_prefix + orjson.dumps(content) + _CONTENT_CHUNK_SUFFIX
+
+    def _create_error_chunk(self, response_id: str, created: int, error_message: str) -> bytes:
         """Создание чанка с ошибкой для потокового ответа"""
-        return f"data: {json.dumps({
-            'id': response_id,
-            'object': 'chat.completion.chunk',
-            'created': int(time.time()),
-            'model': self.model_name,
-            'choices': [{
-                'index': 0,
-                'delta': {
-                    'role': 'assistant',
-                    'content': f"Error: {error_message}"
-                },
-                'finish_reason': 'stop'
-            }]
-        }, ensure_ascii=False)}\n\n"
+        return (self._chunk_prefix(response_id, created) + _ERROR_DELTA_PREFIX
+                + orjson.dumps(f"Error: {error_message}") + _ERROR_CHUNK_SUFFIX)
 
     def _parse_tool_calls_from_buffer(self, buffer: str) -> List[dict]:
+        """Разбор вызовов инструментов: тело каждого вызова вырезается и разбирается один раз"""
         tool_calls = []
-        for match in self.tool_call_pattern.findall(buffer):
+        call_id = None
+        for _, _, match in iter_tool_call_spans(buffer):
             try:
-                tool_calls.append({
-                    "id": f"call_{int(time.time())}",
-                    "type": "function",
-                    "function": {
-                        "name": json.loads(match)['name'],
-                        "arguments": json.dumps(json.loads(match)['arguments'], ensure_ascii=False)
-                    }
-                })
-            except Exception as e:
-                logger.warning(f"Parse error: {e}")
-        return tool_calls
\ No newline at end of file
+                # Тело вызова разбирается один раз
+                data = orjson.loads(match)
+                name = data['name']
+                arguments = orjson.dumps(data['arguments']).decode()
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning("Parse error: %s", e)
+                continue
+            if call_id is None:
+                call_id = f"call_{int(time.time())}"
+            tool_calls.append({
+                "id": call_id,
+                "type": "function",
+                "function": {"name": name, "arguments": arguments}
+            })
+        return tool_calls
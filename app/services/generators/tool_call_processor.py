@@ -1,12 +1,34 @@
-import re
-import json
 import logging
 import time
-from typing import List, Tuple, Optional
+import orjson
+from typing import Iterator, List, Tuple
 from app.models.schemas import ToolCall, FunctionCall
 
 logger = logging.getLogger(__name__)
 
+# Теги вызова инструмента в тексте модели: <tool_call>...</tool_call>
+TOOL_CALL_OPEN = '<tool_call>'
+TOOL_CALL_CLOSE = '</tool_call>'
+
+
+def iter_tool_call_spans(text: str) -> Iterator[Tuple[int, int, str]]:
+    """
+    Закрытые вызовы инструментов в тексте: (начало тега, конец закрывающего тега, тело без пробелов по краям).
+    Теги - фиксированные строки, поэтому ищутся str.find за один проход без движка регулярных выражений.
+    """
+    pos = 0
+    while True:
+        open_idx = text.find(TOOL_CALL_OPEN, pos)
+        if open_idx < 0:
+            return
+        body_start = open_idx + len(TOOL_CALL_OPEN)
+        close_idx = text.find(TOOL_CALL_CLOSE, body_start)
+        if close_idx < 0:
+            # Незакрытый тег остается в тексте как есть
+            return
+        pos = close_idx + len(TOOL_CALL_CLOSE)
+        yield open_idx, pos, text[body_start:close_idx].strip()
+
 
 class ToolCallProcessor:
     """Сервис для обработки и парсинга tool calls из текста модели"""
@@ -18,36 +40,35 @@ class ToolCallProcessor:
         Возвращает (очищенный_текст, список_tool_calls)
         """
         tool_calls = []
-        cleaned_text = text
+        # Текст вне тегов
+        text_parts = []
+        pos = 0
+        # Метка времени для идентификаторов вызовов берется один раз на ответ
+        stamp = int(time.time())
 
-        # Ищем все вхождения <tool_call>...</tool_call>
-        pattern = r'<tool_call>\s*(.*?)\s*</tool_call>'
-        matches = re.findall(pattern, text, re.DOTALL)
+        for i, (start, end, match) in enumerate(iter_tool_call_spans(text)):
+            text_parts.append(text[pos:start])
+            pos = end
 
-        for i, match in enumerate(matches):
             try:
-                tool_data = json.loads(match)
+                tool_data = orjson.loads(match)
 
-                tool_call = ToolCall(
-                    id=f"call_{i}_{int(time.time())}",
+                # Тело разобрано один раз, поля собраны здесь: повторная валидация не нужна
+                tool_call = ToolCall.model_construct(
+                    id=f"call_{i}_{stamp}",
                     type="function",
-                    function=FunctionCall(
-                        name=tool_data.get("name", ""),
-                        arguments=json.dumps(tool_data.get("arguments", {}))
+                    function=FunctionCall.model_construct(
+                        name=str(tool_data.get("name", "")),
+                        arguments=orjson.dumps(tool_data.get("arguments", {})).decode()
                     )
                 )
                 tool_calls.append(tool_call)
 
-            except (json.JSONDecodeError, KeyError) as e:
-                logger.warning(f"Failed to parse tool call: {e}, content: {match}")
-                continue
+            except (orjson.JSONDecodeError, KeyError, AttributeError, TypeError) as e:
+                logger.warning("Failed to parse tool call: %s, content: %s", e, match)
 
-        # Удаляем tool calls из основного текста
-        cleaned_text = re.sub(pattern, '', text, flags=re.DOTALL).strip()
+        # Основной текст без tool calls
+        text_parts.append(text[pos:])
+        cleaned_text = ''.join(text_parts).strip()
 
         return cleaned_text, tool_calls
-
-    @staticmethod
-    def should_use_tools(tools: Optional[List]) -> bool:
-        """Определяет, нужно ли использовать инструменты"""
-        return tools is not None and len(tools) > 0
\ No newline at end of file
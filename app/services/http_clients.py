@@ -0,0 +1,82 @@
+"""
+Общие HTTP клиенты (httpx) с пулом соединений.
+Синхронный клиент один на процесс, асинхронные кэшируются по циклу событий:
+AsyncClient нельзя разделять между циклами (тесты, reloader).
+"""
+
+import asyncio
+import logging
+import os
+import ssl
+import threading
+from typing import Dict, Optional
+
+import httpx
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Таймауты: соединение и ожидание очередного чанка при загрузке больших артефактов
+_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+_lock = threading.Lock()
+_sync_client: Optional[httpx.Client] = None
+_async_clients: Dict[int, httpx.AsyncClient] = {}
+
+
+def _client_options() -> dict:
+    """Параметры клиента Nexus: аутентификация и SSL сертификат из настроек"""
+    nexus = get_settings().nexus
+    options = {"timeout": _TIMEOUT, "follow_redirects": True}
+
+    # Настройка аутентификации
+    if nexus.login and nexus.password:
+        options["auth"] = (nexus.login, nexus.password)
+
+    # Настройка SSL сертификата, если указан путь
+    if nexus.cert_path and os.path.exists(nexus.cert_path):
+        options["verify"] = ssl.create_default_context(cafile=nexus.cert_path)
+
+    return options
+
+
+def get_nexus_http_client() -> httpx.Client:
+    """Синхронный клиент Nexus (соединения переиспользуются между запросами)"""
+    global _sync_client
+    if _sync_client is None:
+        with _lock:
+            if _sync_client is None:
+                _sync_client = httpx.Client(**_client_options())
+    return _sync_client
+
+
+async def async_get_nexus_http_client() -> httpx.AsyncClient:
+    """Асинхронный клиент Nexus для текущего цикла событий"""
+    loop_id = id(asyncio.get_running_loop())
+    client = _async_clients.get(loop_id)
+    if client is None or client.is_closed:
+        with _lock:
+            client = _async_clients.get(loop_id)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(**_client_options())
+                _async_clients[loop_id] = client
+    return client
+
+
+async def close_http_clients() -> None:
+    """Закрытие всех клиентов (при остановке приложения)"""
+    global _sync_client
+    with _lock:
+        sync_client, _sync_client = _sync_client, None
+        async_clients = list(_async_clients.values())
+        _async_clients.clear()
+
+    if sync_client is not None:
+        sync_client.close()
+    for client in async_clients:
+        try:
+            await client.aclose()
+        except RuntimeError as e:
+            # Клиент другого, уже закрытого цикла событий
+            logger.debug("Failed to close async HTTP client: %s", e)
@@ -1,4 +1,6 @@
 import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional, Callable
 from pathlib import Path
 from llama_cpp import Llama
@@ -16,6 +18,8 @@ class ModelContext:
         self.context_id = context_id
         self._model: Optional[Llama] = None
         self._lock = asyncio.Lock()
+        # Все вызовы llama_cpp контекста идут через один выделенный поток
+        self._executor: Optional[ThreadPoolExecutor] = None
 
     async def initialize(self) -> None:
         """Инициализация модели"""
@@ -26,9 +30,9 @@ class ModelContext:
             logger.info(f"[Ctx-{self.context_id}] Initializing model...")
             try:
                 # Создаем модель в executor'е
-                loop = asyncio.get_event_loop()
+                loop = asyncio.get_running_loop()
                 self._model = await loop.run_in_executor(
-                    None,
+                    self.executor,
                     self._create_model
                 )
                 logger.info(f"[Ctx-{self.context_id}] Model initialized successfully")
@@ -43,14 +47,14 @@ class ModelContext:
             await self._run_in_executor(self._model.reset)
             logger.debug(f"[Ctx-{self.context_id}] KV cache reset")
 
-    async def generate(self, **kwargs) -> Any:
-        """Генерация текста"""
+    async def generate(self, params: Dict[str, Any]) -> Any:
+        """Генерация текста (params - параметры create_chat_completion)"""
         if self._model is None:
             raise RuntimeError(f"[Ctx-{self.context_id}] Model is not initialized")
 
         async with self._lock:
             try:
-                return await self._run_in_executor(self._model.create_chat_completion, **kwargs)
+                return await self._run_in_executor(self._model.create_chat_completion, **params)
             except asyncio.TimeoutError:
                 logger.error(f"[Ctx-{self.context_id}] Generation timeout exceeded")
                 raise RuntimeError("Generation timeout")
@@ -68,6 +72,9 @@ class ModelContext:
                     logger.error(f"[Ctx-{self.context_id}] Model cleanup error: {e}")
                 finally:
                     self._model = None
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
 
     def _load_chat_handler(self) -> Any:
         """Загрузка chat handler из шаблона"""
@@ -124,9 +131,20 @@ class ModelContext:
         return Llama(**model_params)
 
     async def _run_in_executor(self, func: Callable, *args, **kwargs) -> Any:
-        """Запуск в executor'е"""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, lambda: func(*args, **kwargs))
+        """Запуск в executor'е (run_in_executor принимает только позиционные аргументы)"""
+        loop = asyncio.get_running_loop()
+        if kwargs:
+            func = functools.partial(func, **kwargs)
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Выделенный поток контекста: модель всегда вызывается из одного потока"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f"llama-ctx-{self.context_id}"
+            )
+        return self._executor
 
     @property
     def is_ready(self) -> bool:
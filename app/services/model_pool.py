@@ -1,6 +1,6 @@
 # app/services/model_pool.py
 import asyncio
-from typing import List
+from typing import List, Optional
 from app.exceptions import ServiceUnavailableError, ModelNotLoadedError, PoolExhaustedError
 from .model_context import ModelContext
 import logging
@@ -21,10 +21,12 @@ class ModelPool:
         self._initialization_failed = False
         self._active_requests = 0  # Счетчик активных запросов
         self._max_active_requests = pool_size  # Максимальное количество одновременных запросов
+        # Очередь ожидания свободного инстанса (ожидающие обслуживаются в порядке FIFO)
+        self._semaphore: Optional[asyncio.Semaphore] = None
 
     async def initialize(self) -> None:
         async with self._lock:
-            logger.info(f"Initializing model pool with {self.pool_size} instances")
+            logger.info("Initializing model pool with %s instances", self.pool_size)
 
             try:
                 self._contexts = []
@@ -44,7 +46,7 @@ class ModelPool:
                 successful_init = 0
                 for i, result in enumerate(results):
                     if isinstance(result, Exception):
-                        logger.error(f"Failed to initialize context {i}: {result}")
+                        logger.error("Failed to initialize context %s: %s", i, result)
                     else:
                         self._available.append(self._contexts[i])
                         successful_init += 1
@@ -55,41 +57,57 @@ class ModelPool:
 
                 self._initialized = True
                 self._max_active_requests = successful_init  # Обновляем максимум на основе успешных инициализаций
-                logger.info(f"Model pool initialized with {successful_init}/{self.pool_size} instances")
+                self._semaphore = asyncio.Semaphore(successful_init)
+                logger.info("Model pool initialized with %s/%s instances", successful_init, self.pool_size)
 
             except Exception as e:
                 self._initialization_failed = True
-                logger.error(f"Model pool initialization failed: {e}")
+                logger.error("Model pool initialization failed: %s", e)
                 raise ServiceUnavailableError(f"Service initialization failed: {str(e)}")
 
-    async def acquire(self) -> ModelContext:
-        """Получение модели из пула с проверкой лимита одновременных запросов"""
+    async def acquire(self, timeout: Optional[float] = None) -> ModelContext:
+        """
+        Получение модели из пула.
+        Если все инстансы заняты, запрос ждет в очереди не дольше timeout секунд.
+        """
+        # Семафор фиксируется вместе с проверкой готовности: cleanup() обнуляет его,
+        # и запрос, совпавший с остановкой, должен получить 503, а не AttributeError
+        semaphore = self._semaphore
+        if not self._initialized or self._initialization_failed or semaphore is None:
+            raise ServiceUnavailableError("Service is not ready")
+
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise PoolExhaustedError(
+                f"Service is busy. No model instance became free within {timeout}s. "
+                f"Maximum concurrent requests: {self._max_active_requests}, "
+                f"Current active requests: {self._active_requests}"
+            )
+
         async with self._lock:
-            if not self._initialized or self._initialization_failed:
+            if semaphore is not self._semaphore:
+                # Пул остановлен или переинициализирован, пока запрос ждал в очереди
+                semaphore.release()
                 raise ServiceUnavailableError("Service is not ready")
 
-            # Проверяем не превышен ли лимит одновременных запросов
-            if self._active_requests >= self._max_active_requests:
-                raise PoolExhaustedError(
-                    f"Service is busy. Maximum concurrent requests: {self._max_active_requests}, "
-                    f"Current active requests: {self._active_requests}, "
-                    f"Total instances: {self.total_count}"
-                )
-
             if not self._available:
+                semaphore.release()
                 raise PoolExhaustedError("No available models in pool")
 
             context = self._available.pop()
             self._in_use.add(context)
             self._active_requests += 1
-            logger.info(f"Acquired model context [Ctx-{context.context_id}]. Active requests: {self._active_requests}")
+            logger.info("Acquired model context [Ctx-%s]. Active requests: %s", context.context_id, self._active_requests)
             return context
 
     async def release(self, context: ModelContext) -> None:
         """Возврат модели в пул с гарантированным освобождением семафора"""
+        acquired = False
         async with self._lock:
             try:
                 if context in self._in_use:
+                    acquired = True
                     self._in_use.remove(context)
                     self._active_requests = max(0, self._active_requests - 1)
                     
@@ -97,22 +115,26 @@ class ModelPool:
                     if context.is_ready:
                         await context.reset_cache()  # Добавляем await
                         self._available.append(context)
-                        logger.info(f"Context [Ctx-{context.context_id}] returned to pool")
+                        logger.info("Context [Ctx-%s] returned to pool", context.context_id)
                     else:
-                        logger.warning(f"Context [Ctx-{context.context_id}] not ready, scheduling reinit")
+                        logger.warning("Context [Ctx-%s] not ready, scheduling reinit", context.context_id)
                         # Запускаем переинициализацию, но не блокируем release
                         asyncio.create_task(self._reinitialize_context(context))
                 else:
-                    logger.warning(f"Context [Ctx-{context.context_id}] not in _in_use during release")
+                    logger.warning("Context [Ctx-%s] not in _in_use during release", context.context_id)
                     # Все равно уменьшаем счетчик для безопасности
                     self._active_requests = max(0, self._active_requests - 1)
                     
             except Exception as e:
-                logger.error(f"Error during context release: {e}")
+                logger.error("Error during context release: %s", e)
                 # Гарантируем уменьшение счетчика даже при ошибке
                 self._active_requests = max(0, self._active_requests - 1)
-        
-        logger.info(f"Released model context [Ctx-{context.context_id}]. Active requests: {self._active_requests}")
+
+        # Пропускаем следующий запрос из очереди ожидания
+        if acquired and self._semaphore is not None:
+            self._semaphore.release()
+
+        logger.info("Released model context [Ctx-%s]. Active requests: %s", context.context_id, self._active_requests)
 
     async def cleanup(self) -> None:
         """Очистка пула"""
@@ -124,6 +146,7 @@ class ModelPool:
             self._available.clear()
             self._in_use.clear()
             self._active_requests = 0
+            self._semaphore = None
             self._initialized = False
             self._initialization_failed = False
 
@@ -1,8 +1,10 @@
 import asyncio
-import uuid
-from typing import List, Optional, AsyncGenerator
-from app.models.schemas import Message, ToolDefinition, ChatCompletionResponse
+import threading
+import orjson
+from typing import Any, Dict, List, Optional, Set, AsyncGenerator
+from app.models.schemas import Message, ToolDefinition, ChatCompletionResponse, HealthResponse, ModelsListResponse
 from app.core.config import settings
+from app.core.ids import random_hex
 from app.exceptions import ServiceUnavailableError
 from .model_pool import ModelPool
 from .generators.non_stream_generator import NonStreamResponseGenerator
@@ -11,6 +13,23 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Признак отсутствия отложенного элемента очереди (None означает конец потока)
+_NO_ITEM = object()
+
+# Сколько чанков модель может сгенерировать впрок, пока клиент их не забрал
+_STREAM_QUEUE_SIZE = 64
+
+
+def _is_content_delta(chunk) -> bool:
+    """Чанк содержит только текст ответа (без роли, вызовов инструментов и finish_reason)"""
+    if not isinstance(chunk, dict):
+        return False
+    choices = chunk.get('choices')
+    if not choices or choices[0].get('finish_reason') is not None:
+        return False
+    delta = choices[0].get('delta')
+    return isinstance(delta, dict) and len(delta) == 1 and isinstance(delta.get('content'), str)
+
 
 class LlamaService:
     """Фасад для работы с моделями LLM"""
@@ -23,6 +42,16 @@ class LlamaService:
         self.model_pool = ModelPool(pool_size=settings.model.pool_size)
         self.model_name = settings.model.name
         self._initialized = False
+        # Повторные и конкурентные вызовы initialize() не загружают модель повторно
+        self._init_lock = asyncio.Lock()
+        self._ready = asyncio.Event()
+
+        # Ответы служебных эндпоинтов (зависят только от состояния модели):
+        # экземпляр схемы валидируется один раз, далее отдаются готовые байты
+        self._models_json: Optional[bytes] = None
+        self._health_json: Optional[bytes] = None
+        # Фоновые задачи (возврат контекстов в пул): ссылки не дают сборщику мусора их удалить
+        self._background_tasks: Set[asyncio.Task] = set()
 
         # Инициализация генераторов с правильными completion caller'ами
         self.non_stream_generator = NonStreamResponseGenerator(
@@ -42,16 +71,31 @@ class LlamaService:
         return cls._instance
 
     async def initialize(self) -> None:
-        """Инициализация сервиса"""
+        """Инициализация сервиса (идемпотентна: модель загружается один раз)"""
         if self._initialized:
             return
 
+        async with self._init_lock:
+            if self._initialized:
+                return
+            await self._initialize()
+
+    async def _initialize(self) -> None:
         try:
             await self.model_pool.initialize()
             self._initialized = True
+            models_response = ModelsListResponse(data=[{
+                "id": self.model_name,
+                "object": "model",
+                "owned_by": "local",
+                "permissions": []
+            }])
+            self._models_json = orjson.dumps(models_response.model_dump())
+            self._health_json = None
+            self._ready.set()
             logger.info("LlamaService initialized successfully")
         except Exception as e:
-            logger.error(f"LlamaService initialization failed: {e}")
+            logger.error("LlamaService initialization failed: %s", e)
             self._initialized = False
             raise ServiceUnavailableError(f"Service initialization failed: {str(e)}")
 
@@ -60,21 +104,35 @@ class LlamaService:
         if self._initialized:
             await self.model_pool.cleanup()
             self._initialized = False
+            self._ready.clear()
+            self._health_json = None
             logger.info("LlamaService cleaned up")
 
-    async def _create_completion(self, session_id: str, **kwargs) -> dict:
-        """Создание non-stream completion"""
-        context = await self.model_pool.acquire()
+    async def wait_ready(self) -> None:
+        """Ожидание завершения инициализации, запущенной другим вызовом"""
+        await self._ready.wait()
+
+    async def _create_completion(self, session_id: str, params: Dict[str, Any]) -> dict:
+        """
+        Создание non-stream completion.
+        Словарь параметров передается по цепочке вызовов как есть и распаковывается
+        только при вызове модели, без пересоздания на каждом уровне через **kwargs
+        """
+        context = await self.model_pool.acquire(timeout=settings.model.queue_timeout)
         try:
-            return await context.generate(**kwargs)
+            return await context.generate(params)
         finally:
             await self.model_pool.release(context)
 
-    async def _create_completion_stream(self, session_id: str, **kwargs) -> AsyncGenerator[dict, None]:
+    async def _create_completion_stream(self, session_id: str, params: Dict[str, Any]) -> AsyncGenerator[dict, None]:
         """Создание stream completion с неблокирующей итерацией."""
         loop = asyncio.get_running_loop()
         queue = asyncio.Queue()
-        context = await self.model_pool.acquire()
+        # Места в очереди: поток модели ждет, если клиент отстал на _STREAM_QUEUE_SIZE чанков
+        slots = threading.Semaphore(_STREAM_QUEUE_SIZE)
+        # Клиент ушел: поток прекращает генерацию
+        stop = threading.Event()
+        context = await self.model_pool.acquire(timeout=settings.model.queue_timeout)
 
         def producer():
             """
@@ -83,26 +141,39 @@ class LlamaService:
             """
             try:
                 # Этот вызов блокирующий, но он выполняется в потоке executor'а
-                kwargs['stream'] = True
-                result_iterator = context._model.create_chat_completion(**kwargs)
+                params['stream'] = True
+                result_iterator = context._model.create_chat_completion(**params)
                 for chunk in result_iterator:
+                    slots.acquire()
+                    if stop.is_set():
+                        break
                     # Помещение в очередь из другого потока должно быть потокобезопасным
                     loop.call_soon_threadsafe(queue.put_nowait, chunk)
             except Exception as e:
-                logger.error(f"Error in stream producer thread: {e}", exc_info=True)
+                logger.error("Error in stream producer thread: %s", e, exc_info=True)
                 # Отправляем ошибку в очередь, чтобы генератор мог ее обработать
                 loop.call_soon_threadsafe(queue.put_nowait, e)
             finally:
                 # Сигнал о завершении
                 loop.call_soon_threadsafe(queue.put_nowait, None)
 
-        # Запускаем producer в отдельном потоке, чтобы не блокировать event loop
-        loop.run_in_executor(None, producer)
+        # Запускаем producer в потоке контекста, чтобы не блокировать event loop
+        producer_future = loop.run_in_executor(context.executor, producer)
+
+        # С инструментами чанки не склеиваются: генератор ищет теги <tool_call> в каждом
+        # delta целиком, и текст рядом с тегом в склеенном delta был бы потерян
+        batch_max_tokens = 1 if params.get('tools') else settings.generation.stream_batch_max_tokens
+        batch_max_ms = settings.generation.stream_batch_max_ms
 
         try:
+            pending = _NO_ITEM
             while True:
                 # Асинхронно ждем следующий элемент из очереди
-                item = await queue.get()
+                if pending is _NO_ITEM:
+                    item = await queue.get()
+                    slots.release()
+                else:
+                    item, pending = pending, _NO_ITEM
 
                 # Завершаем, если получили сигнал
                 if item is None:
@@ -112,11 +183,52 @@ class LlamaService:
                 if isinstance(item, Exception):
                     raise item
 
+                # Текст чанков, которые уже ждут в очереди (модель обогнала клиента),
+                # склеивается в один чанк: один SSE-кадр и одна запись в сокет вместо
+                # нескольких. Без batch_max_ms ожидания нет и задержка токенов не растет
+                if batch_max_tokens > 1 and _is_content_delta(item):
+                    parts = [item['choices'][0]['delta']['content']]
+                    deadline = loop.time() + batch_max_ms / 1000 if batch_max_ms > 0 else None
+                    while len(parts) < batch_max_tokens:
+                        if not queue.empty():
+                            next_item = queue.get_nowait()
+                        elif deadline is not None and deadline > loop.time():
+                            try:
+                                next_item = await asyncio.wait_for(queue.get(), deadline - loop.time())
+                            except asyncio.TimeoutError:
+                                break
+                        else:
+                            break
+                        slots.release()
+                        if not _is_content_delta(next_item):
+                            pending = next_item
+                            break
+                        parts.append(next_item['choices'][0]['delta']['content'])
+                    if len(parts) > 1:
+                        item['choices'][0]['delta']['content'] = ''.join(parts)
+
                 yield item
         finally:
+            # Останавливаем поток модели (и будим его, если он ждет места в очереди):
+            # контекст возвращается в пул только после того, как поток его отпустит
+            stop.set()
+            slots.release()
+            try:
+                await asyncio.shield(producer_future)
+            except asyncio.CancelledError:
+                # Ожидание прервано повторной отменой: контекст вернется в пул,
+                # когда поток завершится, а не пока он еще генерирует
+                producer_future.add_done_callback(lambda _: self._release_later(context))
+                raise
             # Гарантированно возвращаем контекст в пул
             await self.model_pool.release(context)
 
+    def _release_later(self, context) -> None:
+        """Возврат контекста в пул фоновой задачей (ссылка хранится до ее завершения)"""
+        task = asyncio.get_running_loop().create_task(self.model_pool.release(context))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
 
     async def generate_response_non_stream(
             self,
@@ -130,7 +242,7 @@ class LlamaService:
     ) -> ChatCompletionResponse:
         """Не-потоковая генерация ответа"""
         if session_id is None:
-            session_id = f"non_stream_{uuid.uuid4().hex}"
+            session_id = f"non_stream_{random_hex()}"
 
         try:
             return await self.non_stream_generator.generate(
@@ -139,7 +251,7 @@ class LlamaService:
         except ServiceUnavailableError:
             raise
         except Exception as e:
-            logger.error(f"Non-stream generation error: {str(e)}")
+            logger.error("Non-stream generation error: %s", e)
             raise ServiceUnavailableError(f"Generation error: {str(e)}")
 
     async def generate_response_stream(
@@ -151,15 +263,17 @@ class LlamaService:
             presence_penalty: float,
             tools: Optional[List[ToolDefinition]] = None,
             session_id: str = None
-    ) -> AsyncGenerator[str, None]:
-        """Потоковая генерация ответа"""
+    ) -> AsyncGenerator[bytes, None]:
+        """Потоковая генерация ответа (SSE-фреймы уже закодированы в bytes)"""
         if session_id is None:
-            session_id = f"stream_{uuid.uuid4().hex}"
+            session_id = f"stream_{random_hex()}"
 
         async for chunk in self.stream_generator.generate(
                 messages, temperature, max_tokens, frequency_penalty, presence_penalty, tools, session_id
         ):
             yield chunk
+            # Отдаем управление event loop, чтобы фрейм был сразу отправлен клиенту
+            await asyncio.sleep(0)
 
     @property
     def is_loaded(self) -> bool:
@@ -175,3 +289,20 @@ class LlamaService:
     def is_available(self) -> bool:
         """Проверка, есть ли свободные инстансы для обработки запросов"""
         return self._initialized and self.model_pool.available_count > 0
+
+    @property
+    def models_json(self) -> bytes:
+        """Сериализованный ответ /models, формируется один раз при загрузке модели"""
+        return self._models_json
+
+    @property
+    def health_json(self) -> bytes:
+        """Сериализованный ответ /health, сбрасывается при смене состояния сервиса"""
+        if self._health_json is None:
+            loaded = self.is_loaded
+            self._health_json = orjson.dumps(HealthResponse(
+                status="healthy",
+                model_loaded=loaded,
+                model_name=self.model_name if loaded else None,
+            ).model_dump())
+        return self._health_json
@@ -1,8 +1,9 @@
-import requests
 import os
+import threading
 from pathlib import Path
 from typing import Optional
 from app.core.config import get_settings
+from .http_clients import get_nexus_http_client
 
 class NexusClient:
     """Клиент для подключения к Nexus и загрузки артефактов"""
@@ -10,26 +11,20 @@ class NexusClient:
     def __init__(self):
         """Инициализация клиента Nexus"""
         self.settings = get_settings().nexus
-        self.session = requests.Session()
-        
-        # Настройка аутентификации
-        if self.settings.login and self.settings.password:
-            self.session.auth = (self.settings.login, self.settings.password)
-        
-        # Настройка SSL сертификата, если указан путь
-        if self.settings.cert_path and os.path.exists(self.settings.cert_path):
-            self.session.verify = self.settings.cert_path
+        # Общий httpx клиент с пулом соединений (аутентификация и SSL настроены в http_clients)
+        self.session = get_nexus_http_client()
     
     def is_enabled(self) -> bool:
         """Проверка, включена ли загрузка из Nexus"""
         return self.settings.enabled
     
-    def download_artifact(self, destination_path: str) -> bool:
+    def download_artifact(self, destination_path: str, cancel_event: Optional[threading.Event] = None) -> bool:
         """
         Загрузка артефакта из Nexus
         
         Args:
             destination_path: Путь для сохранения загруженного файла
+            cancel_event: Событие отмены загрузки (проверяется после каждого блока)
             
         Returns:
             bool: True если загрузка успешна, False в противном случае
@@ -45,24 +40,32 @@ class NexusClient:
         # Формирование URL для загрузки артефакта
         url = f"{self.settings.url.rstrip('/')}/repository/{self.settings.repo}/{self.settings.id}/{self.settings.version}/{self.settings.file_name}"
         
+        # Файл пишется во временный и переименовывается только после полной загрузки:
+        # прерванная загрузка не оставляет недокачанную модель по пути модели
+        partial_path = destination_path + ".part"
         try:
             print(f"Загрузка артефакта из Nexus: {url}")
-            response = self.session.get(url, stream=True)
-            response.raise_for_status()
-            
-            # Создание директории для сохранения файла, если она не существует
-            Path(destination_path).parent.mkdir(parents=True, exist_ok=True)
-            
-            # Сохранение файла
-            with open(destination_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            
+            with self.session.stream("GET", url) as response:
+                response.raise_for_status()
+
+                # Создание директории для сохранения файла, если она не существует
+                Path(destination_path).parent.mkdir(parents=True, exist_ok=True)
+
+                # Сохранение файла
+                with open(partial_path, 'wb') as f:
+                    for chunk in response.iter_bytes(chunk_size=1024 * 1024):
+                        if cancel_event is not None and cancel_event.is_set():
+                            raise RuntimeError("Загрузка отменена")
+                        f.write(chunk)
+
+            os.replace(partial_path, destination_path)
             print(f"Артефакт успешно загружен в: {destination_path}")
             return True
             
         except Exception as e:
             print(f"Ошибка при загрузке артефакта из Nexus: {str(e)}")
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
             return False
     
     def check_artifact_exists(self) -> bool:
@@ -99,9 +102,10 @@ def get_nexus_client() -> NexusClient:
     return _nexus_client
 
 
-def download_model_from_nexus_if_needed():
+def download_model_from_nexus_if_needed(cancel_event: Optional[threading.Event] = None):
     """
     Загрузка модели из Nexus при необходимости (если файл не существует локально)
+    cancel_event прерывает загрузку, если инициализация отменена или вышла по таймауту
     
     Returns:
         bool: True если загрузка была успешной или не требовалась, False в случае ошибки
@@ -122,4 +126,4 @@ def download_model_from_nexus_if_needed():
     
     # Создаем клиент Nexus и загружаем модель
     nexus_client = get_nexus_client()
-    return nexus_client.download_artifact(model_path)
\ No newline at end of file
+    return nexus_client.download_artifact(model_path, cancel_event)
\ No newline at end of file
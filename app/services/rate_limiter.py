@@ -0,0 +1,147 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Пополнение и списание токена выполняются атомарно одним скриптом (EVALSHA),
+# вместо трех отдельных команд HMGET/HSET/EXPIRE на каждый запрос.
+# Время берется из Redis, чтобы все инстансы сервиса работали по одним часам.
+_TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'last_refill')
+local tokens = tonumber(bucket[1])
+local last_refill = tonumber(bucket[2])
+if tokens == nil then
+    tokens = capacity
+    last_refill = now
+end
+
+tokens = math.min(capacity, tokens + (now - last_refill) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = (1 - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'last_refill', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class MemoryTokenBucket:
+    """Token bucket в памяти процесса: подходит для развертывания в один инстанс"""
+
+    # Максимальное количество ведер: при превышении вытесняется давно неактивное (LRU).
+    # Вытесненный клиент получает полное ведро, как после простоя
+    _MAX_BUCKETS = 10000
+
+    def __init__(self, capacity: int, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def acquire(self, key: str) -> Tuple[bool, float]:
+        """
+        Попытка списать один токен для ключа.
+        Возвращает (разрешено, через сколько секунд появится токен).
+        """
+        # Внутри нет точек переключения (await), поэтому в рамках event loop
+        # пополнение и списание атомарны без дополнительной блокировки
+        now = time.monotonic()
+        tokens, last_refill = self._buckets.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - last_refill) * self.refill_rate)
+
+        buckets = self._buckets
+        if tokens >= 1:
+            buckets[key] = (tokens - 1, now)
+            allowed, retry_after = True, 0.0
+        else:
+            buckets[key] = (tokens, now)
+            allowed, retry_after = False, (1 - tokens) / self.refill_rate
+
+        # O(1) на запрос: ведро переносится в конец, лишнее вытесняется из начала
+        buckets.move_to_end(key)
+        if len(buckets) > self._MAX_BUCKETS:
+            buckets.popitem(last=False)
+
+        return allowed, retry_after
+
+    async def close(self) -> None:
+        """Освобождение ресурсов (для совместимости с RedisTokenBucket)"""
+        self._buckets.clear()
+
+
+class RedisTokenBucket:
+    """
+    Token bucket, хранящий состояние {tokens, last_refill} в Redis.
+    Используется при развертывании в несколько инстансов с общим лимитом.
+    """
+
+    def __init__(self, redis_url: str, capacity: int, refill_rate: float, key_prefix: str):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.key_prefix = key_prefix
+        self._redis = aioredis.from_url(redis_url)
+        self._script = self._redis.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    async def acquire(self, key: str) -> Tuple[bool, float]:
+        """
+        Попытка списать один токен для ключа.
+        Возвращает (разрешено, через сколько секунд появится токен).
+        """
+        allowed, retry_after = await self._script(
+            keys=[f"{self.key_prefix}{key}"],
+            args=[self.capacity, self.refill_rate],
+        )
+        return bool(allowed), float(retry_after)
+
+    async def close(self) -> None:
+        """Закрытие соединений с Redis"""
+        await self._redis.aclose()
+
+
+# Глобальный экземпляр ограничителя
+_rate_limiter: Optional[Union[MemoryTokenBucket, RedisTokenBucket]] = None
+
+
+def get_rate_limiter() -> Union[MemoryTokenBucket, RedisTokenBucket]:
+    """Получение экземпляра ограничителя частоты запросов согласно rate_limit.backend"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        config = settings.rate_limit
+        if config.backend == "redis":
+            _rate_limiter = RedisTokenBucket(
+                redis_url=config.redis_url,
+                capacity=config.capacity,
+                refill_rate=config.refill_rate,
+                key_prefix=config.key_prefix,
+            )
+        else:
+            _rate_limiter = MemoryTokenBucket(
+                capacity=config.capacity,
+                refill_rate=config.refill_rate,
+            )
+    return _rate_limiter
+
+
+async def close_rate_limiter() -> None:
+    """Закрытие ограничителя (соединений с Redis) при остановке приложения"""
+    global _rate_limiter
+    rate_limiter, _rate_limiter = _rate_limiter, None
+    if rate_limiter is not None:
+        await rate_limiter.close()
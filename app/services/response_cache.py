@@ -0,0 +1,70 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import orjson
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Кэш готовых не-потоковых ответов по точному совпадению параметров генерации.
+    LRU с ограничением по времени жизни записи. По умолчанию кэшируются только
+    запросы с temperature == 0: жадное декодирование дает тот же ответ.
+    """
+
+    def __init__(self, max_size: int, ttl: float, allow_sampling: bool = False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.allow_sampling = allow_sampling
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def accepts(self, temperature: Optional[float]) -> bool:
+        """Можно ли кэшировать ответ на запрос с такой температурой"""
+        return self.allow_sampling or temperature == 0
+
+    @staticmethod
+    def make_key(model_name: str, params: Dict[str, Any]) -> str:
+        """Ключ кэша: blake2b от канонического JSON модели и параметров генерации"""
+        payload = orjson.dumps((model_name, params), option=orjson.OPT_SORT_KEYS)
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Ответ из кэша или None, если записи нет или она устарела"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        """Сохранение ответа; при переполнении вытесняется самая давно использованная запись"""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Глобальный кэш ответов (None, если кэширование выключено в настройках)"""
+    global _response_cache
+    if _response_cache is None and settings.caching.enabled:
+        _response_cache = ResponseCache(
+            max_size=settings.caching.max_size,
+            ttl=settings.caching.ttl,
+            allow_sampling=settings.caching.allow_sampling,
+        )
+        logger.info("Response cache enabled: max_size=%d, ttl=%ss", settings.caching.max_size, settings.caching.ttl)
+    return _response_cache
@@ -1,6 +1,7 @@
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from fastapi.testclient import TestClient
+import hashlib
 import os
 
 
@@ -21,101 +22,86 @@ def test_environment():
         del os.environ["CONFIG_PATH"]
 
 
-@pytest.fixture(scope="session", autouse=True)
-def global_mock_llama():
-    """Глобальный мок LlamaHandler на уровне сессии."""
-    with patch('app.dependencies.LlamaHandler') as mock_handler:
-        # Создаем асинхронный мок для экземпляра
-        instance = MagicMock()
-        instance.is_loaded.return_value = True
-        instance.model_name = "test-model"
-        instance.initialized = True
-
-        # Мок для асинхронного метода generate_response, принимаем любые аргументы
-        async def generate_response(*args, **kwargs):
-            return {
-                "id": "test-id",
-                "created": 1234567890,
-                "model": "test-model",
-                "choices": [
-                    {
-                        "index": 0,
-                        "message": {
-                            "role": "assistant",
-                            "content": "Test response from mock handler"
-                        },
-                        "finish_reason": "stop"
-                    }
-                ],
-                "usage": {
-                    "prompt_tokens": 10,
-                    "completion_tokens": 20,
-                    "total_tokens": 30
-                }
-            }
-
-        instance.generate_response = AsyncMock(side_effect=generate_response)
-        instance.initialize = AsyncMock()
-        instance.cleanup = AsyncMock()
-
-        mock_handler.return_value = instance
-        mock_handler.get_instance.return_value = instance
-
-        yield instance
+@pytest.fixture(scope="session")
+def mock_llama_service():
+    """Мок загруженного LlamaService: модель не загружается, генерация возвращает готовый ответ."""
+    from app.models.schemas import (
+        AssistantMessage, ChatCompletionResponse, ChatCompletionResponseChoice,
+        HealthResponse, ModelsListResponse, UsageInfo,
+    )
+
+    service = MagicMock()
+    service.model_name = "test-model"
+    service.is_loaded = True
+    service.is_ready = True
+    service.model_pool.active_requests_count = 0
+    service.model_pool.max_concurrent_requests = 1
+    service.health_json = HealthResponse(
+        status="healthy", model_loaded=True, model_name="test-model"
+    ).model_dump_json().encode()
+    service.models_json = ModelsListResponse(
+        data=[{"id": "test-model", "object": "model", "owned_by": "local", "permissions": []}]
+    ).model_dump_json().encode()
+    service.initialize = AsyncMock()
+    service.generate_response_non_stream = AsyncMock(return_value=ChatCompletionResponse(
+        id="test-id",
+        created=1234567890,
+        model="test-model",
+        choices=[ChatCompletionResponseChoice(
+            index=0,
+            message=AssistantMessage(content="Test response from mock handler"),
+            finish_reason="stop",
+        )],
+        usage=UsageInfo(prompt_tokens=10, completion_tokens=20, total_tokens=30),
+    ))
+
+    yield service
+
 
 @pytest.fixture(scope="session")
-def test_app():
-    """Создание тестового приложения с переопределенными зависимостями."""
-    from app.main import create_application
-    app = create_application()
-    yield app
+def test_app(mock_llama_service):
+    """
+    Тестовое приложение: загрузка из Nexus и создание сервиса подменены,
+    фоновая инициализация сразу завершается с мок-сервисом.
+    """
+    with patch("app.main.download_model_from_nexus_if_needed", return_value=True), \
+            patch("app.main.get_llama_service", AsyncMock(return_value=mock_llama_service)), \
+            patch("app.main.cleanup_llama_service", AsyncMock()):
+        from app.main import create_application
+        app = create_application()
+        yield app
+
 
 @pytest.fixture
-def test_client(test_app):
-    """Создание тестового клиента."""
+def test_client(test_app, mock_llama_service):
+    """Создание тестового клиента с готовым к работе сервисом."""
     with TestClient(test_app) as client:
+        # Не ждем фоновую инициализацию: сервис готов с первого запроса
+        test_app.state.llama_service = mock_llama_service
+        test_app.state.ready = True
         yield client
 
 
 @pytest.fixture
-def auth_enabled_config():
+def auth_enabled_config(monkeypatch):
     """Временное включение аутентификации для тестов."""
-    from app.core.config import get_settings
-
-    settings = get_settings()
+    from app.core import security
 
-    # Сохраняем оригинальные значения
-    original_enabled = settings.security.enabled
-    original_api_key = settings.security.api_key
-
-    # Включаем аутентификацию и устанавливаем тестовый ключ
-    settings.security.enabled = True
-    settings.security.api_key = "test-api-key"
+    # Значения конфигурации привязаны в модуле security при импорте,
+    # поэтому подменяем именно их (monkeypatch восстановит оригиналы)
+    monkeypatch.setattr(security, "_SEC_ENABLED", True)
+    monkeypatch.setattr(security, "_API_KEY_DIGEST", hashlib.sha256(b"test-api-key").digest())
 
     yield
 
-    # Восстанавливаем оригинальные значения
-    settings.security.enabled = original_enabled
-    settings.security.api_key = original_api_key
-
 
 @pytest.fixture
-def auth_enabled_no_key_config():
+def auth_enabled_no_key_config(monkeypatch):
     """Временное включение аутентификации для тестов."""
-    from app.core.config import get_settings
-
-    settings = get_settings()
-
-    # Сохраняем оригинальные значения
-    original_enabled = settings.security.enabled
-    original_api_key = settings.security.api_key
+    from app.core import security
 
     # Включаем аутентификацию и сбрасываем ключ
-    settings.security.enabled = True
-    settings.security.api_key = None
+    monkeypatch.setattr(security, "_SEC_ENABLED", True)
+    monkeypatch.setattr(security, "_API_KEY_DIGEST", None)
 
     yield
-
-    # Восстанавливаем оригинальные значения
-    settings.security.enabled = original_enabled
-    settings.security.api_key = original_api_key
\ No newline at end of file
@@ -35,7 +35,8 @@ def test_chat_completion_without_api_key_auth_enabled(test_client, auth_enabled_
     response = test_client.post("/v1/chat/completions", json=request_data)
 
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
-    assert response.json()["detail"] == "API key is missing"
+    assert response.json()["detail"] == "Invalid API key"
+    assert response.headers["WWW-Authenticate"] == "API-Key"
 
 
 def test_chat_completion_with_invalid_api_key(test_client, auth_enabled_config):
@@ -57,6 +58,7 @@ def test_chat_completion_with_invalid_api_key(test_client, auth_enabled_config):
 
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
     assert response.json()["detail"] == "Invalid API key"
+    assert response.headers["WWW-Authenticate"] == "API-Key"
 
 
 def test_chat_completion_with_valid_api_key(test_client, auth_enabled_config):
@@ -117,4 +119,5 @@ def test_chat_completion_without_api_key_empty_key_config(test_client, auth_enab
     response = test_client.post("/v1/chat/completions", json=request_data)
 
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
-    assert response.json()["detail"] == "API key is not configured on server"
+    assert response.json()["detail"] == "Invalid API key"
+    assert response.headers["WWW-Authenticate"] == "API-Key"
@@ -0,0 +1,36 @@
+from llama_cpp.llama_chat_format import format_chatml
+
+from app.models.schemas import MESSAGES_ADAPTER
+from app.services.generators.non_stream_generator import NonStreamResponseGenerator
+
+
+def _convert(messages):
+    generator = NonStreamResponseGenerator("test-model", completion_caller=None)
+    return generator._convert_messages_to_dict(MESSAGES_ADAPTER.validate_python(messages))
+
+
+def test_tool_call_turns_keep_content_key():
+    """Тест: ход ассистента с tool_calls и ход инструмента форматируются шаблоном llama_cpp."""
+    converted = _convert([
+        {"role": "user", "content": "Погода в Москве?"},
+        {"role": "assistant", "content": None, "tool_calls": [{
+            "id": "call_1", "type": "function",
+            "function": {"name": "get_weather", "arguments": "{\"city\": \"Москва\"}"},
+        }]},
+        {"role": "tool", "tool_call_id": "call_1", "name": "get_weather", "content": "{\"temp\": 20}"},
+    ])
+
+    assistant, tool = converted[1], converted[2]
+    assert assistant["content"] is None
+    assert assistant["tool_calls"][0]["function"]["name"] == "get_weather"
+    assert tool["tool_call_id"] == "call_1"
+
+    prompt = format_chatml(messages=converted).prompt
+    assert "Погода в Москве?" in prompt
+
+
+def test_plain_assistant_message_has_no_tool_calls_key():
+    """Тест: пустой tool_calls не попадает в словарь, как и до перехода на TypeAdapter."""
+    converted = _convert([{"role": "assistant", "content": "Привет"}])
+
+    assert converted == [{"role": "assistant", "content": "Привет"}]
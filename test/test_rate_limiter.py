@@ -0,0 +1,80 @@
+import pytest
+from unittest.mock import patch
+
+from app.services.rate_limiter import MemoryTokenBucket
+
+
+@pytest.mark.asyncio
+async def test_memory_bucket_exhausts_capacity():
+    """Тест исчерпания ведра после capacity запросов."""
+    bucket = MemoryTokenBucket(capacity=2, refill_rate=1.0)
+
+    with patch("app.services.rate_limiter.time.monotonic", return_value=100.0):
+        assert (await bucket.acquire("client"))[0] is True
+        assert (await bucket.acquire("client"))[0] is True
+        allowed, retry_after = await bucket.acquire("client")
+
+    assert allowed is False
+    assert retry_after == pytest.approx(1.0)
+
+
+@pytest.mark.asyncio
+async def test_memory_bucket_refills_over_time():
+    """Тест пополнения ведра со временем."""
+    bucket = MemoryTokenBucket(capacity=1, refill_rate=2.0)
+
+    with patch("app.services.rate_limiter.time.monotonic", return_value=100.0):
+        assert (await bucket.acquire("client"))[0] is True
+        assert (await bucket.acquire("client"))[0] is False
+
+    with patch("app.services.rate_limiter.time.monotonic", return_value=100.5):
+        assert (await bucket.acquire("client"))[0] is True
+
+
+@pytest.mark.asyncio
+async def test_memory_bucket_keys_are_independent():
+    """Тест независимости ведер разных клиентов."""
+    bucket = MemoryTokenBucket(capacity=1, refill_rate=1.0)
+
+    with patch("app.services.rate_limiter.time.monotonic", return_value=100.0):
+        assert (await bucket.acquire("first"))[0] is True
+        assert (await bucket.acquire("second"))[0] is True
+        assert (await bucket.acquire("first"))[0] is False
+
+
+@pytest.mark.asyncio
+async def test_memory_bucket_evicts_least_recently_used():
+    """Тест вытеснения давно неактивного ведра при превышении лимита ключей."""
+    bucket = MemoryTokenBucket(capacity=1, refill_rate=1.0)
+
+    with patch.object(MemoryTokenBucket, "_MAX_BUCKETS", 2), \
+            patch("app.services.rate_limiter.time.monotonic", return_value=100.0):
+        await bucket.acquire("first")
+        await bucket.acquire("second")
+        await bucket.acquire("first")
+        await bucket.acquire("third")
+
+    assert list(bucket._buckets) == ["first", "third"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sec_enabled, expected_prefix", [(False, "ip:"), (True, "key:")])
+async def test_rate_limit_key_follows_auth_check(monkeypatch, sec_enabled, expected_prefix):
+    """Тест: ключ ведра - API ключ только если его принимает проверка аутентификации."""
+    import hashlib
+    from unittest.mock import AsyncMock, MagicMock
+    from app.api import dependencies
+    from app.core import security
+
+    monkeypatch.setattr(security, "_SEC_ENABLED", sec_enabled)
+    monkeypatch.setattr(security, "_API_KEY_DIGEST", hashlib.sha256(b"test-api-key").digest())
+    monkeypatch.setattr(dependencies.settings.rate_limit, "enabled", True)
+    limiter = MagicMock()
+    limiter.acquire = AsyncMock(return_value=(True, 0.0))
+    monkeypatch.setattr(dependencies, "get_rate_limiter", lambda: limiter)
+
+    request = MagicMock()
+    request.client.host = "10.0.0.1"
+    await dependencies.rate_limit(request, api_key="test-api-key")
+
+    assert limiter.acquire.await_args.args[0].startswith(expected_prefix)
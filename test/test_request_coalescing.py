@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from app.exceptions import ServiceUnavailableError
+from app.models.schemas import MESSAGES_ADAPTER
+from app.services.generators.non_stream_generator import NonStreamResponseGenerator
+from app.services.response_cache import ResponseCache
+
+_MESSAGES = MESSAGES_ADAPTER.validate_python([{"role": "user", "content": "Привет"}])
+
+
+def _make_generator(completion_caller, cache_enabled=True):
+    generator = NonStreamResponseGenerator("test-model", completion_caller)
+    generator._response_cache = ResponseCache(max_size=10, ttl=60) if cache_enabled else None
+    return generator
+
+
+async def _generate_concurrently(generator, count=3):
+    return await asyncio.gather(
+        *(generator.generate(_MESSAGES, 0, 16, 0, 0) for _ in range(count)),
+        return_exceptions=True,
+    )
+
+
+@pytest.mark.asyncio
+async def test_followers_share_leader_response():
+    """Тест: одинаковые одновременные запросы вызывают модель один раз."""
+    calls = 0
+
+    async def completion_caller(session_id, params):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"choices": [{"message": {"content": "Ответ"}, "finish_reason": "stop"}]}
+
+    responses = await _generate_concurrently(_make_generator(completion_caller))
+
+    assert calls == 1
+    assert [r.choices[0].message.content for r in responses] == ["Ответ"] * 3
+    assert len({r.id for r in responses}) == 3
+
+
+@pytest.mark.asyncio
+async def test_followers_get_leader_error_response():
+    """Тест: при ошибке модели все запросы получают одинаковый ответ с ошибкой."""
+    async def completion_caller(session_id, params):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    responses = await _generate_concurrently(_make_generator(completion_caller))
+
+    assert [r.choices[0].message.content for r in responses] == ["Error: boom"] * 3
+
+
+@pytest.mark.asyncio
+async def test_followers_get_503_when_leader_cancelled():
+    """Тест: отмена ведущего запроса отдает ожидающим 503 для повтора."""
+    async def completion_caller(session_id, params):
+        await asyncio.sleep(10)
+
+    generator = _make_generator(completion_caller)
+    leader = asyncio.create_task(generator.generate(_MESSAGES, 0, 16, 0, 0))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(generator.generate(_MESSAGES, 0, 16, 0, 0))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    with pytest.raises(ServiceUnavailableError):
+        await follower
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    assert generator._inflight == {}
+
+
+@pytest.mark.asyncio
+async def test_no_coalescing_when_caching_disabled():
+    """Тест: при выключенном кэше каждый запрос вызывает модель."""
+    calls = 0
+
+    async def completion_caller(session_id, params):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"choices": [{"message": {"content": "Ответ"}, "finish_reason": "stop"}]}
+
+    await _generate_concurrently(_make_generator(completion_caller, cache_enabled=False))
+
+    assert calls == 3
@@ -0,0 +1,45 @@
+from unittest.mock import patch
+
+from app.services.response_cache import ResponseCache
+
+
+def test_cache_key_ignores_dict_order():
+    """Тест независимости ключа от порядка полей параметров."""
+    first = ResponseCache.make_key("model", {"temperature": 0, "messages": [{"role": "user", "content": "hi"}]})
+    second = ResponseCache.make_key("model", {"messages": [{"content": "hi", "role": "user"}], "temperature": 0})
+
+    assert first == second
+    assert first != ResponseCache.make_key("other", {"temperature": 0, "messages": [{"role": "user", "content": "hi"}]})
+
+
+def test_cache_entry_expires_after_ttl():
+    """Тест устаревания записи по истечении ttl."""
+    cache = ResponseCache(max_size=10, ttl=5)
+
+    with patch("app.services.response_cache.time.monotonic", return_value=100.0):
+        cache.put("key", "response")
+        assert cache.get("key") == "response"
+
+    with patch("app.services.response_cache.time.monotonic", return_value=105.0):
+        assert cache.get("key") is None
+
+
+def test_cache_evicts_least_recently_used():
+    """Тест вытеснения давно неиспользованной записи при переполнении."""
+    cache = ResponseCache(max_size=2, ttl=60)
+
+    cache.put("first", 1)
+    cache.put("second", 2)
+    cache.get("first")
+    cache.put("third", 3)
+
+    assert cache.get("first") == 1
+    assert cache.get("second") is None
+    assert cache.get("third") == 3
+
+
+def test_cache_accepts_only_greedy_decoding_by_default():
+    """Тест кэширования только запросов с temperature == 0 без allow_sampling."""
+    assert ResponseCache(max_size=1, ttl=1).accepts(0) is True
+    assert ResponseCache(max_size=1, ttl=1).accepts(0.7) is False
+    assert ResponseCache(max_size=1, ttl=1, allow_sampling=True).accepts(0.7) is True